@@ -1 +1,6 @@
-VERSION = "1.2.5"
\ No newline at end of file
+VERSION = "1.2.5"
+
+"""
+Extensions loaded by the bot
+"""
+EXTENSIONS = ('EventBot.ext.EventManager',)
@@ -1,15 +1,25 @@
-from .bot import bot_factory
-from .config import BotConfig
-import discord
+"""
+Command line. discord.py and the extensions are only imported by the run command.
+"""
 
 
-def bot_run():
+def bot_run(record: str = None, member_cache: int = None):
     """
     Main class to execute the Bot
+    :param record: File where the gateway dispatches are recorded
+    :param member_cache: Low memory mode: number of members kept by guild
     :return:
     """
+    from .bot import bot_factory
+    from .config import BotConfig
+    from .log import setup_logging
     from appdirs import AppDirs
+    import discord
+    import logging
+
+    logger = logging.getLogger(__name__)
     dirs = AppDirs(appname='EventDiscordBot', appauthor='Bontiv', roaming=True)
+    BotConfig.member_cache_size = member_cache
     bot = bot_factory()
 
     @bot.listen()
@@ -18,44 +28,53 @@ def bot_run():
         Action when the bot is ready
         :return:
         """
-        print("Ready please visit:")
         url = discord.utils.oauth_url(client_id=BotConfig.client_id, permissions=BotConfig.permissions)
-        print(url)  # Print URL for connect the bot on a guild
-        BotConfig.from_guild_id(bot, 702217269320614028)
+        logger.info("Ready please visit: %s", url)  # URL for connect the bot on a guild
 
     from os.path import exists, join
     from os import makedirs
 
     file = join(dirs.user_config_dir, "config.ini")
     makedirs(dirs.user_config_dir, exist_ok=True)
+    makedirs(dirs.user_data_dir, exist_ok=True)
+    BotConfig.open_store(join(dirs.user_data_dir, "events.db"))
     if exists(file):
-        bot.run(BotConfig.load_file(file))
+        listener = setup_logging()
+        secret = BotConfig.load_file(file, bot)
+        bot.loop.create_task(BotConfig.watch_file(bot, file))
+        recorder = None
+        if record is not None:
+            from .recorder import GatewayRecorder
+            recorder = GatewayRecorder(record)
+            bot.add_listener(recorder.on_socket_response)
+        try:
+            bot.run(secret)
+        finally:
+            if recorder is not None:
+                recorder.close()
+            listener.stop()
     else:
         print("Configuration missing !")
         print("Path: {}".format(file))
 
 
 def config_run(cfg):
-    from os.path import exists, join
+    from os.path import join
     from os import makedirs
     from appdirs import AppDirs
+    from .metadata import read_config
 
     dirs = AppDirs(appname='EventDiscordBot', appauthor='Bontiv', roaming=True)
 
     file = join(dirs.user_config_dir, "config.ini")
     makedirs(dirs.user_config_dir, exist_ok=True)
-    client_secret = None
-    if exists(file):
-        client_secret = BotConfig.load_file(file)
+    config = read_config(file)
 
     if cfg.config == 'show':
-        print("ClientID: {}".format(BotConfig.client_id))
-        print("Secret: {}".format(client_secret))
+        print("ClientID: {}".format(config['DEFAULT'].get('client')))
+        print("Secret: {}".format(config['DEFAULT'].get('secret')))
 
     if cfg.config == 'set':
-        import configparser
-        config = configparser.ConfigParser()
-        config.read(file)
         config['DEFAULT'][cfg.parameter] = cfg.value
         with open(file, 'w') as fp:
             config.write(fp)
@@ -67,9 +86,28 @@ def main_run():
 
     args = argparse.ArgumentParser()
     commands = args.add_subparsers(title='Commands', dest='command')
-    commands.add_parser('run')
+    run = commands.add_parser('run')
+    run.add_argument('--record', metavar='FILE', help='Record the gateway dispatches for a replay')
+    run.add_argument('--member-cache', type=int, metavar='SIZE',
+                     help='Low memory mode: members are not requested at startup, SIZE members kept by guild')
     commands.add_parser('upgrade')
     commands.add_parser('version')
+    replay = commands.add_parser('replay', help='Replay recorded gateway dispatches against the bot')
+    replay.add_argument('file')
+    replay.add_argument('--speed', type=float, default=1.0, help='Replay speed (100 for 100x)')
+    replay.add_argument('--open', type=int, action='append', default=[], metavar='MESSAGE_ID',
+                        help='Announce to open before the replay')
+    storm = commands.add_parser('storm', help='Write a synthetic record of a reaction storm')
+    storm.add_argument('file')
+    storm.add_argument('--users', type=int, default=500)
+    storm.add_argument('--reactions', type=int, default=2000)
+    storm.add_argument('--duration', type=float, default=10.0, help='Storm duration (seconds)')
+    bench = commands.add_parser('bench', help='Benchmark the cogs on a fake guild')
+    bench.add_argument('--members', type=int, default=1000)
+    bench.add_argument('--announces', type=int, default=500)
+    bench.add_argument('--reactions', type=int, default=200)
+    bench.add_argument('--temp-messages', type=int, default=300)
+    bench.add_argument('--latency', type=float, default=0.0, help='Simulated REST latency (ms)')
     config = commands.add_parser('config')
     sub_config = config.add_subparsers(title='configuration', dest='config')
     show_config = sub_config.add_parser('show')
@@ -80,15 +118,28 @@ def main_run():
 
     cfg = args.parse_args()
     if cfg.command == 'run':
-        bot_run()
+        bot_run(cfg.record, cfg.member_cache)
 
     if cfg.command == 'config':
         config_run(cfg)
 
     if cfg.command == 'version':
         import tabulate
-        bot = bot_factory()
-        print(tabulate.tabulate(bot.version().items(), headers=['Component', 'Version']))
+        from .metadata import versions
+        print(tabulate.tabulate(versions().items(), headers=['Component', 'Version']))
+
+    if cfg.command == 'replay':
+        from .bench.replay import run
+        run(cfg.file, cfg.speed, cfg.open)
+
+    if cfg.command == 'storm':
+        from .bench.replay import storm
+        announce_id = storm(cfg.file, cfg.users, cfg.reactions, cfg.duration)
+        print("Replay with: discordeventbot replay {} --open {}".format(cfg.file, announce_id))
+
+    if cfg.command == 'bench':
+        from .bench.cogs import run
+        run(cfg.members, cfg.announces, cfg.reactions, cfg.temp_messages, cfg.latency / 1000)
 
     if cfg.command == 'upgrade':
         from pip import main
@@ -0,0 +1,4 @@
+"""
+Benchmarks of the bot hot paths.
+Each module can be run alone: python -m EventBot.bench.<module>
+"""
@@ -0,0 +1,142 @@
+"""
+Benchmark of the cogs operations on a fake guild: wall time and REST calls of each operation
+"""
+from EventBot.bench.fake import FakeBot, FakeContext, FakeGuild, FakeMember, FakeRole
+from EventBot.config import BotConfig
+from datetime import datetime, timedelta
+import asyncio
+import time
+import typing
+
+
+def build(bot: FakeBot, members: int, announces: int, reactions: int, temp_messages: int) -> FakeGuild:
+    """
+    Build a guild with the default configuration IDs.
+    The newest announce is the next event and can be opened now, the other ones are later.
+    :param bot: Fake bot
+    :param members: Number of members
+    :param announces: Number of announces
+    :param reactions: Number of ✅ on the next event
+    :param temp_messages: Number of messages in the temp channel
+    :return:
+    """
+    conf = BotConfig.register(BotConfig(bot))
+    guild = bot.add_guild(conf.guild_id)
+    player_role = guild.roles.setdefault(conf.role_id, FakeRole(guild, conf.role_id, "Joueur"))
+    guild.roles.setdefault(conf.gm_role_id, FakeRole(guild, conf.gm_role_id, "MJ"))
+
+    announce = guild.add_channel(conf.announce_id, "annonces")
+    temp = guild.add_channel(conf.temp_channel_id, "table")
+    guild.add_channel(conf.heading_id, "📅Pas de soirée à venir")
+    guild.add_channel(conf.general_voice_id, "Général")
+    voices = [guild.add_channel(channel_id, "Vocal {}".format(i)) for i, channel_id in enumerate(conf.voices_chans_ids)]
+
+    first_member = 10 ** 17
+    for i in range(members):
+        member = guild.members.setdefault(first_member + i, FakeMember(guild, first_member + i))
+        if i % 2 == 0 and i < reactions:
+            member.roles.append(player_role)
+        if i < 3 * len(voices):
+            member.voice_channel = voices[i % len(voices)]
+            member.voice_channel.members.append(member)
+
+    utcnow, now = datetime.utcnow(), datetime.now()
+    for i in range(announces - 1, -1, -1):
+        date = now + timedelta(minutes=30) + (timedelta(days=1 + i % 300) if i else timedelta())
+        message = announce.add_message(
+            "**Soirée {}**\nÉvénement prévu le {} !\nMaitre du jeu : <@{}>\nCliquez sur ✅ pour participer.".format(
+                i, date.strftime("%d/%m à %H h %M"), first_member + i % max(members, 1)
+            ),
+            utcnow - timedelta(minutes=i)
+        )
+        if i == 0:
+            check = message.reaction("✅")
+            check.me = True
+            check.user_ids = [first_member + j for j in range(min(reactions, members))]
+            message.reaction("👍").user_ids = [first_member]
+
+    for i in range(temp_messages):
+        temp.add_message("Lien de table {}".format(i), utcnow - timedelta(minutes=i))
+    return guild
+
+
+async def measure(bot: FakeBot, name: str, operation: typing.Awaitable) -> typing.Tuple[str, float, int, str]:
+    """
+    Run an operation and record its wall time and REST calls
+    :param bot: Fake bot
+    :param name: Label
+    :param operation: The operation
+    :return: (label, milliseconds, number of calls, calls by route)
+    """
+    bot.api.reset()
+    start = time.perf_counter()
+    await operation
+    elapsed = time.perf_counter() - start
+    calls = ", ".join("{} {}".format(route, count) for route, count in sorted(bot.api.calls.items()))
+    return name, elapsed * 1000, bot.api.total, calls
+
+
+async def bench(members: int, announces: int, reactions: int, temp_messages: int,
+                latency: float) -> typing.List[typing.Tuple[str, float, int, str]]:
+    """
+    Run the operations in the order of an event life: list, opening, reconciliation, closing
+    :return: Measures
+    """
+    from EventBot.ext.EventManager import BotManagementCog, EventManagementCog, ReactionsCog
+    from EventBot.ext.EventManager.helpers import reset_game
+
+    BotConfig._config_cache.clear()
+    BotConfig.open_store(':memory:')
+    bot = FakeBot(latency)
+    guild = build(bot, members, announces, reactions, temp_messages)
+    conf = BotConfig.from_guild_id(bot, guild.id)
+
+    planner = EventManagementCog(bot)
+    admin = BotManagementCog(bot)
+    reactions_cog = ReactionsCog(bot)
+    for cog in (planner, admin, reactions_cog):
+        bot.add_cog(cog)
+    await reactions_cog.restored.wait()
+
+    ctx = FakeContext(bot, guild, next(iter(guild.members.values()), None))
+    results = [
+        await measure(bot, ".list (cold index)", planner.list.callback(planner, ctx)),
+        await measure(bot, ".list (cached page)", planner.list.callback(planner, ctx)),
+        await measure(bot, "update (open event)", admin.run_update(conf)),
+        await measure(bot, "update (no change)", admin.run_update(conf)),
+    ]
+    event = reactions_cog.guild_events(conf.guild_id)[0]
+    results.append(await measure(bot, "reconcile", reactions_cog.reconcile(event)))
+    results.append(await measure(bot, "reset_game", reset_game(conf)))
+    await conf.roles.wait_drained()
+
+    admin.cog_unload()
+    return results
+
+
+def run(members: int = 1000, announces: int = 500, reactions: int = 200, temp_messages: int = 300,
+        latency: float = 0.0) -> None:
+    """
+    Print the benchmark table
+    :param members: Number of members
+    :param announces: Number of announces
+    :param reactions: Number of ✅ on the next event
+    :param temp_messages: Number of messages in the temp channel
+    :param latency: Simulated REST latency (seconds)
+    :return:
+    """
+    import tabulate
+
+    results = asyncio.get_event_loop().run_until_complete(
+        bench(members, announces, reactions, temp_messages, latency)
+    )
+    print("{} members, {} announces, {} reactions, {} temp messages, {:.0f} ms latency".format(
+        members, announces, reactions, temp_messages, latency * 1000
+    ))
+    print(tabulate.tabulate(
+        results, headers=['Operation', 'Wall ms', 'API calls', 'Calls by route'], floatfmt=".1f"
+    ))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,88 @@
+"""
+Benchmark of the configuration properties used in the command and update hot paths,
+with the resolved objects cache and without it (every property resolves from the bot cache).
+discord.py looks a channel up in each guild in turn, so the cost grows with the number of guilds.
+"""
+from EventBot.bench.replay import guild_payload
+from EventBot.config import BotConfig
+import discord
+import timeit
+import typing
+
+
+def build(guilds: int, members: int) -> BotConfig:
+    """
+    Bot with a connection cache holding guilds like the configured one. The configured guild is the last one looked up.
+    :param guilds: Number of guilds
+    :param members: Number of members of each guild
+    :return: Configuration of the last guild
+    """
+    bot = discord.Client()
+    state = bot._connection
+    conf = BotConfig(bot)
+    for i in range(guilds - 1, -1, -1):
+        other = BotConfig(bot)
+        shift = i * 100
+        other.guild_id, other.role_id = conf.guild_id + shift, conf.role_id + shift
+        other.gm_role_id = conf.gm_role_id + shift
+        other.announce_id, other.temp_channel_id = conf.announce_id + shift, conf.temp_channel_id + shift
+        other.heading_id, other.general_voice_id = conf.heading_id + shift, conf.general_voice_id + shift
+        other.voices_chans_ids = [channel_id + shift for channel_id in conf.voices_chans_ids]
+        member_ids = [10 ** 17 + shift + j for j in range(members)]
+        state._add_guild(discord.Guild(data=guild_payload(other, 'Guilde {}'.format(i), member_ids), state=state))
+    return conf
+
+
+def hot_path(conf: BotConfig) -> None:
+    """
+    Accesses of an update and a game reset
+    :param conf: Guild configuration
+    :return:
+    """
+    conf.heading.name
+    conf.announce
+    conf.temp_channel
+    conf.player_role
+    conf.gm_role
+    for channel in conf.voices_channels:
+        channel.members
+
+
+def bench(guilds: int, members: int, repeat: int) -> typing.Tuple[float, float]:
+    """
+    Time the hot path
+    :param guilds: Number of guilds
+    :param members: Number of members of each guild
+    :param repeat: Number of runs
+    :return: (microseconds without cache, microseconds with cache) by run
+    """
+    conf = build(guilds, members)
+
+    def uncached() -> None:
+        conf._resolved.clear()
+        hot_path(conf)
+
+    uncached_time = min(timeit.repeat(uncached, number=repeat, repeat=3)) / repeat
+    cached_time = min(timeit.repeat(lambda: hot_path(conf), number=repeat, repeat=3)) / repeat
+    return uncached_time * 10 ** 6, cached_time * 10 ** 6
+
+
+def run(guild_counts: typing.Sequence[int] = (1, 10, 100, 1000), members: int = 10, repeat: int = 2000) -> None:
+    """
+    Print the benchmark table
+    :param guild_counts: Numbers of guilds to try
+    :param members: Number of members of each guild
+    :param repeat: Number of runs of the hot path
+    :return:
+    """
+    import tabulate
+
+    rows = []
+    for guilds in guild_counts:
+        uncached, cached = bench(guilds, members, repeat)
+        rows.append([guilds, uncached, cached, uncached / cached])
+    print(tabulate.tabulate(rows, headers=['Guilds', 'Resolved µs', 'Cached µs', 'Speedup'], floatfmt=".2f"))
+
+
+if __name__ == '__main__':
+    run()
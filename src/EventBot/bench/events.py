@@ -0,0 +1,102 @@
+"""
+Memory of an event index of historical announces: immutable event records against the previous
+events holding their announce message and configuration.
+"""
+from EventBot.bench.messages import state_factory
+from EventBot.bench.replay import guild_payload, user_payload
+from EventBot.config import BotConfig
+from EventBot.index import EventIndex
+from EventBot.objects import EventMessage
+from datetime import datetime, timedelta
+import discord
+import gc
+import tracemalloc
+import typing
+
+
+class LegacyEventMessage:
+    """
+    Previous event layout: parsed fields with the announce message and the configuration
+    """
+
+    def __init__(self, config: BotConfig, message: discord.Message):
+        record = EventMessage.from_message(message)
+        self.date = record.date
+        self.close_date = record.close_date
+        self.open_date = record.open_date
+        self.name = record.name
+        self.games_masters = list(record.games_masters)
+        self.players = None
+        self.message = message
+        self.config = config
+        self.id = message.id
+
+
+def announces(count: int) -> typing.Tuple[BotConfig, typing.List[dict]]:
+    """
+    Announce payloads, one a day in the past
+    :param count: Number of announces
+    :return: (configuration, MESSAGE_CREATE payloads)
+    """
+    conf = BotConfig(None)
+    now = datetime.utcnow()
+    payloads = []
+    for i in range(count):
+        date = now - timedelta(days=i)
+        payloads.append({
+            'id': str(discord.utils.time_snowflake(date - timedelta(days=2))), 'channel_id': str(conf.announce_id),
+            'guild_id': str(conf.guild_id), 'author': user_payload(10 ** 17 + i % 50),
+            'content': "**Soirée {}**\nÉvénement prévu le {} !\nMaitre du jeu : <@{}>\n"
+                       "Cliquez sur ✅ pour participer.".format(i, date.strftime("%d/%m à %H h %M"), 10 ** 17 + i % 50),
+            'timestamp': date.isoformat(), 'edited_timestamp': None, 'tts': False, 'mention_everyone': False,
+            'mentions': [user_payload(10 ** 17 + i % 50)], 'mention_roles': [], 'attachments': [],
+            'embeds': [], 'pinned': False, 'type': 0,
+            'reactions': [{'emoji': {'id': None, 'name': '✅'}, 'count': 12, 'me': True}],
+        })
+    return conf, payloads
+
+
+def index_memory(legacy: bool, count: int) -> typing.Tuple[float, float]:
+    """
+    Build an event index from announces and measure the memory it keeps
+    :param legacy: Previous event layout
+    :param count: Number of announces
+    :return: (KB held by the index, bytes by event)
+    """
+    state = state_factory(False)
+    conf, payloads = announces(count)
+    guild = discord.Guild(data=guild_payload(conf, 'Historique', []), state=state)
+    state._add_guild(guild)
+    channel = guild.get_channel(conf.announce_id)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    index = EventIndex()
+    for payload in payloads:
+        message = discord.Message(state=state, channel=channel, data=payload)
+        index.put(LegacyEventMessage(conf, message) if legacy else EventMessage.from_message(message))
+        del message
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return held / 1024, held / max(len(index), 1)
+
+
+def run(counts: typing.Sequence[int] = (1000, 10000)) -> None:
+    """
+    Print the comparison table
+    :param counts: Numbers of announces
+    :return:
+    """
+    import tabulate
+
+    rows = []
+    for count in counts:
+        for name, legacy in (('Message + config', True), ('Slots record', False)):
+            rows.append([name, count] + list(index_memory(legacy, count)))
+    print(tabulate.tabulate(rows, headers=['Event', 'Announces', 'Index KB', 'Bytes/event'], floatfmt=".0f"))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,352 @@
+"""
+In-process fake of the parts of discord.py used by the cogs, to run them without a guild.
+Every REST call is counted and waits for a simulated latency.
+"""
+from datetime import datetime, timedelta
+import asyncio
+import discord
+import typing
+
+"""
+Messages returned by a history request (like the Discord API)
+"""
+HISTORY_PAGE = 100
+
+"""
+Users returned by a reaction users request (like the Discord API)
+"""
+REACTION_USERS_PAGE = 100
+
+
+class FakeAPI:
+    """
+    Count the REST calls and simulate their latency
+    """
+
+    def __init__(self, latency: float = 0.0):
+        """
+        :param latency: Duration of each call (seconds)
+        """
+        self.latency = latency
+        self.calls: typing.Dict[str, int] = {}
+
+    async def call(self, route: str) -> None:
+        """
+        Record a call
+        :param route: Call name
+        :return:
+        """
+        self.calls[route] = self.calls.get(route, 0) + 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+    @property
+    def total(self) -> int:
+        """
+        Number of calls
+        :return:
+        """
+        return sum(self.calls.values())
+
+    def reset(self) -> None:
+        """
+        Forget the recorded calls
+        :return:
+        """
+        self.calls.clear()
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+    def __str__(self) -> str:
+        return "User#{}".format(self.id)
+
+
+class FakeMember(FakeUser):
+    def __init__(self, guild: 'FakeGuild', user_id: int):
+        super().__init__(user_id)
+        self.guild = guild
+        self.roles: typing.List['FakeRole'] = []
+        self.voice_channel: typing.Optional['FakeChannel'] = None
+
+    async def move_to(self, channel: typing.Optional['FakeChannel']) -> None:
+        await self.guild.api.call('move_member')
+        if self.voice_channel is not None:
+            self.voice_channel.members.remove(self)
+        self.voice_channel = channel
+        if channel is not None:
+            channel.members.append(self)
+
+    async def send(self, content: str) -> None:
+        await self.guild.api.call('send_dm')
+
+
+class FakeRole:
+    def __init__(self, guild: 'FakeGuild', role_id: int, name: str):
+        self.guild = guild
+        self.id = role_id
+        self.name = name
+
+    @property
+    def members(self) -> typing.List[FakeMember]:
+        return [member for member in self.guild.members.values() if self in member.roles]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeReaction:
+    def __init__(self, message: 'FakeMessage', emoji: str, me: bool = False):
+        self.message = message
+        self.emoji = emoji
+        self.me = me
+        self.user_ids: typing.List[int] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.user_ids) + (1 if self.me else 0)
+
+    async def users(self) -> typing.AsyncIterator[FakeUser]:
+        user_ids = ([self.message.guild.bot.user.id] if self.me else []) + self.user_ids
+        for start in range(0, len(user_ids), REACTION_USERS_PAGE):
+            await self.message.guild.api.call('reaction_users')
+            for user_id in user_ids[start:start + REACTION_USERS_PAGE]:
+                yield FakeUser(user_id)
+
+
+class FakeMessage:
+    def __init__(self, channel: 'FakeChannel', message_id: int, content: str):
+        self.channel = channel
+        self.guild = channel.guild
+        self.id = message_id
+        self.content = content
+        self.edited_at = None
+        self.reactions: typing.List[FakeReaction] = []
+
+    @property
+    def created_at(self) -> datetime:
+        return discord.utils.snowflake_time(self.id)
+
+    def reaction(self, emoji: str) -> FakeReaction:
+        """
+        Get or add a reaction (without API call)
+        :param emoji: The emoji
+        :return:
+        """
+        for reaction in self.reactions:
+            if reaction.emoji == emoji:
+                return reaction
+        reaction = FakeReaction(self, emoji)
+        self.reactions.append(reaction)
+        return reaction
+
+    async def add_reaction(self, emoji: str) -> None:
+        await self.guild.api.call('add_reaction')
+        self.reaction(str(emoji)).me = True
+
+    async def clear_reaction(self, emoji) -> None:
+        await self.guild.api.call('clear_reaction')
+        self.reactions = [reaction for reaction in self.reactions if reaction.emoji != str(emoji)]
+
+    async def delete(self) -> None:
+        await self.guild.api.call('delete_message')
+        self.channel.messages.pop(self.id, None)
+
+
+class FakeHistory:
+    """
+    Channel history iterator, one request per page
+    """
+
+    def __init__(self, channel: 'FakeChannel', limit: typing.Optional[int], before=None, after=None):
+        ids = sorted(channel.messages, reverse=after is None)
+        if before is not None:
+            ids = [message_id for message_id in ids if message_id < before.id]
+        if after is not None:
+            ids = [message_id for message_id in ids if message_id > after.id]
+        self.channel = channel
+        self.ids = ids if limit is None else ids[:limit]
+
+    async def __aiter__(self) -> typing.AsyncIterator[FakeMessage]:
+        for start in range(0, max(len(self.ids), 1), HISTORY_PAGE):
+            await self.channel.guild.api.call('history')
+            for message_id in self.ids[start:start + HISTORY_PAGE]:
+                if message_id in self.channel.messages:
+                    yield self.channel.messages[message_id]
+
+    async def flatten(self) -> typing.List[FakeMessage]:
+        return [message async for message in self]
+
+
+class FakeChannel:
+    """
+    Text or voice channel
+    """
+
+    def __init__(self, guild: 'FakeGuild', channel_id: int, name: str, created_at: datetime):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.position = 0
+        self.created_at = created_at
+        self.messages: typing.Dict[int, FakeMessage] = {}
+        self.members: typing.List[FakeMember] = []
+
+    def add_message(self, content: str, created_at: datetime) -> FakeMessage:
+        """
+        Add a message (without API call)
+        :param content: Message content
+        :param created_at: Creation date
+        :return:
+        """
+        message_id = discord.utils.time_snowflake(created_at)
+        while message_id in self.messages:
+            message_id += 1
+        message = FakeMessage(self, message_id, content)
+        self.messages[message_id] = message
+        return message
+
+    def history(self, limit: typing.Optional[int] = 100, before=None, after=None) -> FakeHistory:
+        return FakeHistory(self, limit, before, after)
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        await self.guild.api.call('fetch_message')
+        return self.messages[message_id]
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return self.messages.get(message_id) or FakeMessage(self, message_id, "")
+
+    async def send(self, content: str) -> FakeMessage:
+        await self.guild.api.call('send_message')
+        return self.add_message(content, datetime.utcnow())
+
+    async def delete_messages(self, messages: typing.Sequence[FakeMessage]) -> None:
+        await self.guild.api.call('bulk_delete')
+        for message in messages:
+            self.messages.pop(message.id, None)
+
+    async def edit(self, name: str = None, position: int = None, reason: str = None) -> None:
+        await self.guild.api.call('edit_channel')
+        if name is not None:
+            self.name = name
+        if position is not None:
+            self.position = position
+
+    async def clone(self, reason: str = None) -> 'FakeChannel':
+        await self.guild.api.call('create_channel')
+        channel = FakeChannel(self.guild, self.id + 1, self.name, datetime.utcnow())
+        self.guild.channels[channel.id] = channel
+        return channel
+
+    async def delete(self, reason: str = None) -> None:
+        await self.guild.api.call('delete_channel')
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeGuild:
+    def __init__(self, bot: 'FakeBot', guild_id: int):
+        self.bot = bot
+        self.api = bot.api
+        self.id = guild_id
+        self.members: typing.Dict[int, FakeMember] = {}
+        self.roles: typing.Dict[int, FakeRole] = {}
+        self.channels: typing.Dict[int, FakeChannel] = {}
+
+    def get_member(self, user_id: int) -> typing.Optional[FakeMember]:
+        return self.members.get(user_id)
+
+    def get_role(self, role_id: int) -> typing.Optional[FakeRole]:
+        return self.roles.get(role_id)
+
+    def add_channel(self, channel_id: int, name: str, created_at: datetime = None) -> FakeChannel:
+        """
+        Add a channel (without API call)
+        :param channel_id: Channel ID
+        :param name: Channel name
+        :param created_at: Creation date
+        :return:
+        """
+        channel = FakeChannel(self, channel_id, name, created_at or datetime.utcnow() - timedelta(days=365))
+        self.channels[channel_id] = channel
+        return channel
+
+
+class FakeHTTP:
+    """
+    Low level REST calls used by the role queue
+    """
+
+    def __init__(self, bot: 'FakeBot'):
+        self.bot = bot
+
+    async def add_role(self, guild_id: int, user_id: int, role_id: int, reason: str = None) -> None:
+        await self.bot.api.call('add_role')
+        guild = self.bot.get_guild(guild_id)
+        member, role = guild.get_member(user_id), guild.get_role(role_id)
+        if member is not None and role not in member.roles:
+            member.roles.append(role)
+
+    async def remove_role(self, guild_id: int, user_id: int, role_id: int, reason: str = None) -> None:
+        await self.bot.api.call('remove_role')
+        guild = self.bot.get_guild(guild_id)
+        member, role = guild.get_member(user_id), guild.get_role(role_id)
+        if member is not None and role in member.roles:
+            member.roles.remove(role)
+
+
+class FakeBot:
+    """
+    Bot connected to fake guilds. It is always ready, but its periodic tasks never start.
+    """
+
+    def __init__(self, latency: float = 0.0, user_id: int = 1):
+        self.api = FakeAPI(latency)
+        self.http = FakeHTTP(self)
+        self.user = FakeUser(user_id)
+        self.loop = asyncio.get_event_loop()
+        self.guilds: typing.Dict[int, FakeGuild] = {}
+        self.cogs: typing.Dict[str, typing.Any] = {}
+
+    def add_guild(self, guild_id: int) -> FakeGuild:
+        guild = FakeGuild(self, guild_id)
+        self.guilds[guild_id] = guild
+        return guild
+
+    def get_guild(self, guild_id: int) -> typing.Optional[FakeGuild]:
+        return self.guilds.get(guild_id)
+
+    def get_channel(self, channel_id: int) -> typing.Optional[FakeChannel]:
+        for guild in self.guilds.values():
+            if channel_id in guild.channels:
+                return guild.channels[channel_id]
+        return None
+
+    def add_cog(self, cog) -> None:
+        self.cogs[cog.qualified_name] = cog
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    def is_ready(self) -> bool:
+        return True
+
+    async def wait_until_ready(self) -> None:
+        await asyncio.Event().wait()
+
+
+class FakeContext:
+    """
+    Command context
+    """
+
+    def __init__(self, bot: FakeBot, guild: FakeGuild, author: FakeMember):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.sent: typing.List[str] = []
+
+    async def send(self, content: str) -> None:
+        await self.bot.api.call('send_message')
+        self.sent.append(content)
@@ -0,0 +1,77 @@
+"""
+Import time of the command line and of the bot, from python -X importtime
+"""
+import subprocess
+import sys
+import time
+import typing
+
+"""
+Modules measured: the command line entry point must stay light, the others show the cost of a run
+"""
+TARGETS = ('EventBot.__main__', 'EventBot.bot', 'EventBot.ext.EventManager')
+
+"""
+Modules that the command line must not import before the run command
+"""
+HEAVY_MODULES = ('discord', 'aiohttp', 'EventBot.bot', 'EventBot.ext.EventManager')
+
+
+def import_times(module: str) -> typing.Dict[str, typing.Tuple[int, int]]:
+    """
+    Import a module in a new interpreter and read the import times
+    :param module: Module name
+    :return: (self µs, cumulative µs) by imported module
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def command_time(args: typing.Sequence[str], repeat: int = 5) -> float:
+    """
+    Wall time of a command line call (best of several runs)
+    :param args: Command arguments
+    :param repeat: Number of runs
+    :return: Elapsed seconds
+    """
+    elapsed = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'EventBot'] + list(args), stdout=subprocess.DEVNULL, check=True)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return elapsed
+
+
+def run(top: int = 10) -> None:
+    """
+    Print the import time of each target and its slowest imports
+    :param top: Number of slowest imports shown
+    :return:
+    """
+    for target in TARGETS:
+        times = import_times(target)
+        print("{:<28} {:>9.1f} ms {:>5} modules".format(target, times[target][1] / 1000, len(times)))
+        for name, (self_us, _) in sorted(times.items(), key=lambda item: -item[1][0])[:top]:
+            print("    {:<40} {:>9.1f} ms".format(name, self_us / 1000))
+
+    heavy = [name for name in import_times('EventBot.__main__') if name.startswith(HEAVY_MODULES)]
+    if heavy:
+        print("Command line imports heavy modules: {}".format(", ".join(sorted(heavy))))
+
+    print("{:<28} {:>9.1f} ms".format("discordeventbot version", command_time(['version']) * 1000))
+
+
+if __name__ == '__main__':
+    run()
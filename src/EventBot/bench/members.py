@@ -0,0 +1,138 @@
+"""
+Startup time and resident memory of the member cache modes on a large guild:
+every member cached (requested by chunks at startup) or the low memory mode (nothing requested at startup,
+LRU of the recently seen members).
+Each mode runs in its own process, so the memory of one does not count in the other.
+"""
+from EventBot.config import BotConfig
+import gc
+import json
+import sys
+import time
+import typing
+
+"""
+Members by gateway chunk (like Discord)
+"""
+CHUNK_SIZE = 1000
+
+
+def rss() -> float:
+    """
+    Resident memory of the process (MB)
+    :return:
+    """
+    try:
+        import os
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def startup(low_memory: bool, members: int, cache_size: int) -> dict:
+    """
+    Build the member cache of the real bot (bot_factory) as it is at the end of the startup
+    :param low_memory: Low memory mode
+    :param members: Number of members of the guild
+    :param cache_size: LRU size in low memory mode (filled with seen members)
+    :return: Measures
+    """
+    from EventBot.bench.replay import guild_payload, member_payload
+    from EventBot.bot import bot_factory
+    import discord
+
+    BotConfig.open_store(':memory:')
+    BotConfig.metrics_port = None
+    BotConfig.member_cache_size = cache_size if low_memory else None
+    bot = bot_factory()
+    state = bot._connection
+    state.user = discord.ClientUser(state=state, data={
+        'id': '1', 'username': 'EventBot', 'discriminator': '0000', 'avatar': None, 'bot': True
+    })
+    conf = BotConfig.register(BotConfig(bot))
+    first_user = 10 ** 17
+
+    gc.collect()
+    base = rss()
+    elapsed = 0.0
+    chunks = 0
+
+    start = time.perf_counter()
+    data = guild_payload(conf, 'Membres', [1])
+    data['member_count'], data['large'] = members + 1, True
+    guild = discord.Guild(data=data, state=state)
+    state._add_guild(guild)
+    elapsed += time.perf_counter() - start
+
+    if low_memory:
+        seen = [member_payload(first_user + i) for i in range(min(cache_size, members))]
+        start = time.perf_counter()
+        for payload in seen:
+            conf.members.add(discord.Member(data=payload, guild=guild, state=state))
+        elapsed += time.perf_counter() - start
+    else:
+        for offset in range(0, members, CHUNK_SIZE):
+            chunk = [member_payload(first_user + i) for i in range(offset, min(offset + CHUNK_SIZE, members))]
+            start = time.perf_counter()
+            for payload in chunk:
+                guild._add_member(discord.Member(data=payload, guild=guild, state=state))
+            elapsed += time.perf_counter() - start
+            chunks += 1
+
+    del data, guild
+    gc.collect()
+    return {
+        'startup_ms': elapsed * 1000,
+        'rss_mb': rss() - base,
+        'cached': len(bot.get_guild(conf.guild_id)._members) + len(conf.members.members),
+        'chunks': chunks,
+    }
+
+
+def bench(members: int, cache_size: int) -> typing.Dict[str, dict]:
+    """
+    Run each mode in a child process
+    :param members: Number of members of the guild
+    :param cache_size: LRU size in low memory mode
+    :return: Measures by mode
+    """
+    import subprocess
+
+    results = {}
+    for mode in ('full', 'low'):
+        output = subprocess.run(
+            [sys.executable, '-m', 'EventBot.bench.members', '--child', mode, str(members), str(cache_size)],
+            stdout=subprocess.PIPE, check=True
+        ).stdout
+        results[mode] = json.loads(output.decode().strip().splitlines()[-1])
+    return results
+
+
+def run(members: int = 50000, cache_size: int = 1000) -> None:
+    """
+    Print the comparison table
+    :param members: Number of members of the guild
+    :param cache_size: LRU size in low memory mode
+    :return:
+    """
+    import tabulate
+
+    results = bench(members, cache_size)
+    print("{} members, LRU of {} members in low memory mode".format(members, cache_size))
+    print("Startup is the local parsing only: each gateway chunk also costs a round trip in the full mode.")
+    print(tabulate.tabulate(
+        [
+            [name, result['cached'], result['chunks'], result['startup_ms'], result['rss_mb']]
+            for name, result in (('Full cache', results['full']), ('Low memory', results['low']))
+        ],
+        headers=['Mode', 'Cached members', 'Gateway chunks', 'Startup ms', 'RSS MB'], floatfmt=".1f"
+    ))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        print(json.dumps(startup(sys.argv[2] == 'low', int(sys.argv[3]), int(sys.argv[4]))))
+    else:
+        run()
@@ -0,0 +1,104 @@
+"""
+Memory of the message cache under guild chat: discord.py's cache of the last messages of every channel
+against the cache limited to the announce and temp channels.
+The messages are fed to the connection state parser, like the gateway does.
+"""
+from EventBot.bench.replay import channel_payload, guild_payload, user_payload
+from EventBot.config import BotConfig
+from datetime import datetime
+import asyncio
+import discord
+import time
+import tracemalloc
+import typing
+
+
+def state_factory(targeted: bool) -> discord.state.ConnectionState:
+    """
+    Connection state without a gateway
+    :param targeted: Cache limited to the announce and temp channels
+    :return:
+    """
+    from discord.state import ConnectionState
+    from EventBot.messages import TargetedConnectionState
+
+    options = dict(
+        dispatch=lambda *args, **kwargs: None, handlers={}, hooks={}, syncer=None, http=None,
+        loop=asyncio.get_event_loop(), intents=BotConfig.intents,
+    )
+    if targeted:
+        return TargetedConnectionState(
+            channels=BotConfig.message_channel_ids, size=BotConfig.message_cache_size, **options
+        )
+    return ConnectionState(**options)
+
+
+def feed(targeted: bool, messages: int, chat_channels: int, watched_share: float) -> typing.Tuple[int, float, float]:
+    """
+    Feed chat messages to a new connection state
+    :param targeted: Cache limited to the announce and temp channels
+    :param messages: Number of messages
+    :param chat_channels: Number of chat channels
+    :param watched_share: Share of the messages posted in the announce and temp channels
+    :return: (cached messages, memory held by the cache in KB, lookup of an uncached message in µs)
+    """
+    BotConfig._config_cache.clear()
+    state = state_factory(targeted)
+    conf = BotConfig.register(BotConfig(None))
+    first_chat = conf.guild_id + 10 ** 6
+    data = guild_payload(conf, 'Discussions', [])
+    data['channels'] += [channel_payload(first_chat + i, 'discussion-{}'.format(i), 0) for i in range(chat_channels)]
+    guild = discord.Guild(data=data, state=state)
+    state._add_guild(guild)
+
+    watched_every = int(1 / watched_share) if watched_share > 0 else 0
+    now = datetime.utcnow()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(messages):
+        if watched_every and i % watched_every == 0:
+            channel_id = (conf.announce_id, conf.temp_channel_id)[(i // watched_every) % 2]
+        else:
+            channel_id = first_chat + i % max(chat_channels, 1)
+        state.parsers['MESSAGE_CREATE']({
+            'id': str(discord.utils.time_snowflake(now) + i), 'channel_id': str(channel_id),
+            'guild_id': str(conf.guild_id), 'content': "Message {} ".format(i) * 8,
+            'author': user_payload(10 ** 17 + i % 500), 'timestamp': now.isoformat(), 'edited_timestamp': None,
+            'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+            'embeds': [], 'pinned': False, 'type': 0,
+        })
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        state._get_message(1)
+    lookup = (time.perf_counter() - start) / 1000
+    return len(state._messages), held / 1024, lookup * 10 ** 6
+
+
+def run(volumes: typing.Sequence[int] = (1000, 10000, 50000), chat_channels: int = 20,
+        watched_share: float = 0.02) -> None:
+    """
+    Print the comparison table
+    :param volumes: Numbers of messages to feed
+    :param chat_channels: Number of chat channels
+    :param watched_share: Share of the messages posted in the announce and temp channels
+    :return:
+    """
+    import tabulate
+
+    rows = []
+    for messages in volumes:
+        for name, targeted in (('Global', False), ('Targeted', True)):
+            rows.append([name, messages] + list(feed(targeted, messages, chat_channels, watched_share)))
+    print("{} chat channels, {:.0%} of the messages in the announce and temp channels, {} kept by channel".format(
+        chat_channels, watched_share, BotConfig.message_cache_size
+    ))
+    print(tabulate.tabulate(
+        rows, headers=['Cache', 'Messages', 'Cached', 'Held KB', 'Lookup µs'], floatfmt=".1f"
+    ))
+
+
+if __name__ == '__main__':
+    run()
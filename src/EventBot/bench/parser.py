@@ -0,0 +1,96 @@
+from EventBot.objects import parse_announce, clear_parse_cache, PARSE_CACHE_SIZE
+from datetime import datetime
+import re
+import time
+import typing
+
+"""
+Discord epoch (first second of 2015), used to build synthetic snowflakes
+"""
+DISCORD_EPOCH = 1420070400000
+
+
+def legacy_parse(content: str) -> typing.Tuple[typing.Optional[datetime], str, typing.List[str]]:
+    """
+    Previous EventMessage parser (uncompiled regexes, datetime.now() per message)
+    :param content: Message content
+    :return:
+    """
+    import re
+
+    date = None
+    name = "Soirée jeux"
+    date_element = re.search(r'([0-9]{2})/([0-9]{2}) à ([0-9]{2}) h ([0-9]{2})', content)
+    name_parse = re.search(r'\*\*(.*)\*\*', content)
+    if name_parse is not None:
+        name = name_parse.group(1)
+    if date_element is not None:
+        now = datetime.now()
+        day = int(date_element.group(1))
+        month = int(date_element.group(2))
+        hour = int(date_element.group(3))
+        minutes = int(date_element.group(4))
+        year = now.year + 1 if now.month > month else now.year
+        date = datetime(year=year, month=month, day=day, hour=hour, minute=minutes)
+
+    return date, name, re.findall('<@([^>]*)>', content)
+
+
+def synthetic_announces(count: int) -> typing.List[typing.Tuple[int, str]]:
+    """
+    Build announces like the ones sent by the add command
+    :param count: Number of announces
+    :return: List of (message ID, content)
+    """
+    announces = []
+    timestamp = int(time.time() * 1000) - DISCORD_EPOCH
+    for i in range(count):
+        message_id = (timestamp - i * 60000) << 22
+        announces.append((message_id, """
+                **Soirée {i}**
+                Événement prévu le {day:02}/{month:02} à {hour:02} h 30 !
+                Maitre du jeu : <@{gm}>
+                Cliquez sur ✅ pour participer.
+                """.format(i=i, day=i % 28 + 1, month=i % 12 + 1, hour=i % 24, gm=364004307550601218 + i)))
+    return announces
+
+
+def measure(name: str, function: typing.Callable, announces: typing.List[typing.Tuple[int, str]],
+            setup: typing.Callable = None, repeat: int = 5) -> float:
+    """
+    Time a parser on all announces (best of several runs)
+    :param name: Label
+    :param function: Parser, called with (message ID, content)
+    :param announces: Announces to parse
+    :param setup: Called before each run
+    :param repeat: Number of runs
+    :return: Elapsed seconds
+    """
+    elapsed = float('inf')
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for message_id, content in announces:
+            function(message_id, content)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print("{:<28} {:>9.1f} ms {:>9.2f} µs/announce".format(name, elapsed * 1000, elapsed * 1e6 / len(announces)))
+    return elapsed
+
+
+def run(count: int = 10000) -> None:
+    """
+    Compare the legacy parser with the compiled and cached one
+    :param count: Number of synthetic announces
+    :return:
+    """
+    announces = synthetic_announces(count)
+    re.purge()
+    print("Parsing {} announces".format(count))
+    measure("legacy", lambda message_id, content: legacy_parse(content), announces)
+    measure("compiled (cold cache)", parse_announce, announces, setup=clear_parse_cache)
+    measure("compiled (warm cache)", parse_announce, announces[:min(count, PARSE_CACHE_SIZE)])
+
+
+if __name__ == '__main__':
+    run()
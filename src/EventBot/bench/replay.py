@@ -0,0 +1,362 @@
+"""
+Replay of recorded gateway traffic against the real bot (bot_factory), with a local stand-in of the REST API.
+The dispatches are fed to the bot connection parsers, like the gateway websocket does, at a chosen speed.
+"""
+from EventBot import metrics
+from EventBot.config import BotConfig
+from EventBot.recorder import GatewayRecorder, read
+from datetime import datetime
+from urllib.parse import unquote
+import asyncio
+import discord
+import json
+import re
+import typing
+
+"""
+Events replayed before the timed phase, to build the bot cache
+"""
+SETUP_EVENTS = ('READY', 'GUILD_CREATE')
+
+"""
+Snowflakes in a REST path, replaced to group the calls by route
+"""
+SNOWFLAKE_PATTERN = re.compile(r'/[0-9]{15,21}(?=/|$)')
+REACTION_PATTERN = re.compile(r'/reactions/[^/]+')
+
+
+def route_name(method: str, path: str) -> str:
+    """
+    Route of a REST call, without IDs and emojis
+    :param method: HTTP method
+    :param path: Request path
+    :return:
+    """
+    path = REACTION_PATTERN.sub('/reactions/{emoji}', SNOWFLAKE_PATTERN.sub('/{id}', path))
+    return "{} {}".format(method, path)
+
+
+class StandInServer:
+    """
+    Local stand-in of the Discord REST API: answers every call with a plausible payload and counts it
+    """
+
+    def __init__(self, user: dict):
+        """
+        :param user: Bot user payload
+        """
+        self.user = user
+        self.calls: typing.Dict[str, int] = {}
+        self.messages: typing.Dict[int, dict] = {}
+        self.channels: typing.Dict[int, dict] = {}
+        self.runner = None
+
+    def add_guild(self, guild: dict) -> None:
+        """
+        Keep the channels of a guild, for the channel edits
+        :param guild: GUILD_CREATE payload
+        :return:
+        """
+        for channel in guild.get('channels', ()):
+            self.channels[int(channel['id'])] = dict(channel, guild_id=guild['id'])
+
+    def message(self, channel_id: int, message_id: int, content: str = "") -> dict:
+        """
+        Message payload
+        :param channel_id: Channel ID
+        :param message_id: Message ID
+        :param content: Message content
+        :return:
+        """
+        return self.messages.get(message_id) or {
+            'id': str(message_id), 'channel_id': str(channel_id), 'content': content, 'author': self.user,
+            'timestamp': discord.utils.snowflake_time(message_id).isoformat(), 'edited_timestamp': None,
+            'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+            'embeds': [], 'pinned': False, 'type': 0, 'reactions': [],
+        }
+
+    @staticmethod
+    def json(data):
+        """
+        JSON response (discord.py expects the content type without charset)
+        :param data: Payload
+        :return:
+        """
+        from aiohttp import web
+        return web.Response(body=json.dumps(data).encode(), content_type='application/json')
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        path = request.path.split('/api/v7', 1)[-1]
+        route = route_name(request.method, unquote(path))
+        self.calls[route] = self.calls.get(route, 0) + 1
+        ids = [int(part[1:]) for part in SNOWFLAKE_PATTERN.findall(path)]
+
+        if route == 'GET /users/@me':
+            return self.json(self.user)
+        if route == 'GET /channels/{id}/messages/{id}':
+            return self.json(self.message(ids[0], ids[1]))
+        if route in ('GET /channels/{id}/messages', 'GET /channels/{id}/messages/{id}/reactions/{emoji}'):
+            return self.json([])
+        if route == 'POST /channels/{id}/messages':
+            body = await request.json()
+            message_id = discord.utils.time_snowflake(datetime.utcnow())
+            return self.json(self.message(ids[0], message_id, body.get('content') or ""))
+        if route == 'PATCH /channels/{id}':
+            channel = self.channels.get(ids[0]) or channel_payload(ids[0], "", 0)
+            channel.update(await request.json())
+            self.channels[ids[0]] = channel
+            return self.json(channel)
+        if request.method in ('PUT', 'DELETE'):
+            return web.Response(status=204)
+        return self.json({})
+
+    async def start(self) -> str:
+        """
+        Listen on a free local port
+        :return: Base URL of the API
+        """
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return "http://127.0.0.1:{}/api/v7".format(port)
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+
+async def replay(path: str, speed: float = 1.0, open_ids: typing.Sequence[int] = ()) -> dict:
+    """
+    Replay a record against a new bot
+    :param path: Record file
+    :param speed: Replay speed (100 for 100x faster than recorded)
+    :param open_ids: Announces to open before the replay
+    :return: Report
+    """
+    from EventBot.bot import bot_factory
+
+    records = list(read(path))
+    setup = [record for record in records if record[1] in SETUP_EVENTS]
+    traffic = [record for record in records if record[1] not in SETUP_EVENTS]
+    ready = next(data for _, event, data in setup if event == 'READY')
+
+    server = StandInServer(ready['user'])
+    for _, event, data in setup:
+        if event == 'GUILD_CREATE':
+            server.add_guild(data)
+    for _, event, data in traffic:
+        if event == 'MESSAGE_CREATE':
+            server.messages[int(data['id'])] = data
+    discord.http.Route.BASE = await server.start()
+
+    BotConfig.open_store(':memory:')
+    BotConfig.metrics_port = None
+    bot = bot_factory()
+    BotConfig.register(BotConfig(bot))
+    state = bot._connection
+    state._chunk_guilds = False
+    state.guild_ready_timeout = 0.1
+
+    await bot.login('replay', bot=True)
+    for _, event, data in setup:
+        state.parsers[event](data)
+    await asyncio.wait_for(bot.wait_until_ready(), 30)
+    await bot.get_cog('reactions').restored.wait()
+    for conf in BotConfig.get_all():
+        if conf.announce is not None:
+            await conf.sync_events()
+            for message_id in open_ids:
+                await conf.reactions_cog.watch(await conf.announce.fetch_message(message_id))
+
+    for metric in metrics.METRICS:
+        metric.values.clear()
+    server.calls.clear()
+
+    loop = asyncio.get_event_loop()
+    first = traffic[0][0] if traffic else 0
+    start = loop.time()
+    skipped = 0
+    for offset, event, data in traffic:
+        delay = (offset - first) / 1000 / speed - (loop.time() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        parser = state.parsers.get(event)
+        if parser is None:
+            skipped += 1
+            continue
+        parser(data)
+    replayed = loop.time() - start
+
+    await asyncio.sleep(max(BotConfig.reaction_debounce, BotConfig.stray_reaction_window) + 0.1)
+    for conf in BotConfig.get_all():
+        await conf.roles.wait_drained()
+    await asyncio.sleep(0)
+
+    report = {
+        'dispatches': len(traffic) - skipped,
+        'skipped': skipped,
+        'replay_seconds': replayed,
+        'total_seconds': loop.time() - start,
+        'listeners': {
+            labels[0]: (
+                metrics.LISTENERS.count(*labels),
+                metrics.LISTENERS.quantile(0.5, *labels),
+                metrics.LISTENERS.quantile(0.95, *labels),
+                metrics.LISTENERS.quantile(0.99, *labels),
+            )
+            for labels in metrics.LISTENERS.values
+        },
+        'rest': dict(server.calls),
+    }
+    await bot.close()
+    await server.stop()
+    return report
+
+
+def user_payload(user_id: int) -> dict:
+    """
+    User payload
+    :param user_id: User ID
+    :return:
+    """
+    return {'id': str(user_id), 'username': 'Joueur{}'.format(user_id), 'discriminator': '0001', 'avatar': None}
+
+
+def member_payload(user_id: int) -> dict:
+    """
+    Member payload
+    :param user_id: User ID
+    :return:
+    """
+    return {'user': user_payload(user_id), 'roles': [], 'joined_at': datetime.utcnow().isoformat(),
+            'deaf': False, 'mute': False}
+
+
+def channel_payload(channel_id: int, name: str, channel_type: int) -> dict:
+    """
+    Guild channel payload
+    :param channel_id: Channel ID
+    :param name: Channel name
+    :param channel_type: 0 for text, 2 for voice
+    :return:
+    """
+    return {'id': str(channel_id), 'type': channel_type, 'name': name, 'position': 0, 'permission_overwrites': []}
+
+
+def role_payload(role_id: int, name: str) -> dict:
+    """
+    Role payload
+    :param role_id: Role ID
+    :param name: Role name
+    :return:
+    """
+    return {'id': str(role_id), 'name': name, 'permissions': '0', 'position': 0, 'color': 0,
+            'hoist': False, 'managed': False, 'mentionable': False}
+
+
+def guild_payload(conf: BotConfig, name: str, member_ids: typing.Sequence[int]) -> dict:
+    """
+    GUILD_CREATE payload of a guild with the channels and roles of a configuration
+    :param conf: Guild configuration
+    :param name: Guild name
+    :param member_ids: Member IDs
+    :return:
+    """
+    return {
+        'id': str(conf.guild_id), 'name': name, 'member_count': len(member_ids), 'large': False, 'features': [],
+        'emojis': [], 'voice_states': [], 'presences': [], 'owner_id': '1',
+        'roles': [
+            role_payload(conf.guild_id, '@everyone'), role_payload(conf.role_id, 'Joueur'),
+            role_payload(conf.gm_role_id, 'MJ'),
+        ],
+        'channels': [
+            channel_payload(conf.announce_id, 'annonces', 0),
+            channel_payload(conf.temp_channel_id, 'table', 0),
+            channel_payload(conf.heading_id, '📅Pas de soirée à venir', 2),
+            channel_payload(conf.general_voice_id, 'Général', 2),
+        ] + [channel_payload(channel_id, 'Vocal', 2) for channel_id in conf.voices_chans_ids],
+        'members': [member_payload(user_id) for user_id in member_ids],
+    }
+
+
+def storm(path: str, users: int = 500, reactions: int = 2000, duration: float = 10.0) -> int:
+    """
+    Write a synthetic record of a reaction storm at event opening, on a guild with the default configuration IDs
+    :param path: Record file
+    :param users: Number of members
+    :param reactions: Number of ✅ added or removed
+    :param duration: Storm duration (seconds)
+    :return: Announce message ID (to open before the replay)
+    """
+    import random
+
+    conf = BotConfig(None)
+    now = datetime.utcnow()
+    bot_user = {'id': '1', 'username': 'EventBot', 'discriminator': '0000', 'avatar': None, 'bot': True}
+
+    first_user = 10 ** 17
+    announce_id = discord.utils.time_snowflake(now)
+    recorder = GatewayRecorder(path)
+    recorder.write('READY', {
+        'v': 8, 'user': bot_user, 'session_id': 'storm', 'relationships': [], 'private_channels': [],
+        'guilds': [{'id': str(conf.guild_id), 'unavailable': True}],
+    }, 0)
+    recorder.write('GUILD_CREATE', guild_payload(conf, 'Storm', [1] + [first_user + i for i in range(users)]), 0)
+    recorder.write('MESSAGE_CREATE', {
+        'id': str(announce_id), 'channel_id': str(conf.announce_id), 'guild_id': str(conf.guild_id),
+        'content': "**Storm**\nÉvénement prévu le {} !\nCliquez sur ✅ pour participer.".format(
+            now.strftime("%d/%m à %H h %M")),
+        'author': bot_user, 'timestamp': now.isoformat(), 'edited_timestamp': None, 'tts': False,
+        'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [], 'embeds': [],
+        'pinned': False, 'type': 0,
+    }, 0)
+
+    registered = set()
+    for i in range(reactions):
+        user_id = first_user + random.randrange(users)
+        event = 'MESSAGE_REACTION_REMOVE' if user_id in registered else 'MESSAGE_REACTION_ADD'
+        registered ^= {user_id}
+        data = {
+            'user_id': str(user_id), 'message_id': str(announce_id), 'channel_id': str(conf.announce_id),
+            'guild_id': str(conf.guild_id), 'emoji': {'id': None, 'name': '✅'},
+        }
+        if event == 'MESSAGE_REACTION_ADD':
+            data['member'] = member_payload(user_id)
+        recorder.write(event, data, duration * i / max(reactions, 1))
+    recorder.close()
+    return announce_id
+
+
+def run(path: str, speed: float = 1.0, open_ids: typing.Sequence[int] = ()) -> None:
+    """
+    Replay a record and print the report
+    :param path: Record file
+    :param speed: Replay speed
+    :param open_ids: Announces to open before the replay
+    :return:
+    """
+    import tabulate
+
+    report = asyncio.get_event_loop().run_until_complete(replay(path, speed, open_ids))
+    print("{} dispatches replayed in {:.2f} s at {}x ({} unknown events skipped), settled in {:.2f} s".format(
+        report['dispatches'], report['replay_seconds'], speed, report['skipped'], report['total_seconds']
+    ))
+    print(tabulate.tabulate(
+        [
+            [event, count] + ["{:g}".format(value * 1000) for value in quantiles]
+            for event, (count, *quantiles) in sorted(report['listeners'].items(), key=lambda item: -item[1][0])
+        ],
+        headers=['Listener', 'Calls', 'p50 ms', 'p95 ms', 'p99 ms']
+    ))
+    print()
+    print(tabulate.tabulate(
+        sorted(report['rest'].items(), key=lambda item: -item[1]) + [['Total', sum(report['rest'].values())]],
+        headers=['REST route', 'Calls']
+    ))
@@ -1,6 +1,31 @@
 from discord.ext import commands
-from .config import BotConfig
+from .config import BotConfig, GuildNotConfigured
+from . import metrics
+import asyncio
+import collections
 import discord
+import functools
+import logging
+import sys
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+"""
+Package installed by the upgrade command
+"""
+UPGRADE_SOURCE = 'git+https://github.com/bontiv/event-discord-bot.git#egg=DiscordEventBot'
+
+"""
+Min delay between two edits of the upgrade progress message (seconds)
+"""
+UPGRADE_PROGRESS_INTERVAL = 2.0
+
+"""
+Number of pip output lines shown in the upgrade progress message
+"""
+UPGRADE_PROGRESS_LINES = 10
 
 
 class GameContext(commands.Context):
@@ -40,9 +65,118 @@ class GameContext(commands.Context):
 
 
 class GameBot(commands.Bot):
+    def __init__(self, *args, **kwargs):
+        super(GameBot, self).__init__(*args, **kwargs)
+        self.http.request = self._timed_request(self.http.request)
+        self.metrics_server = None
+        metrics.watch_rate_limits()
+        if BotConfig.member_cache_size is not None:
+            self._watch_members()
+
+    def _get_state(self, **options):
+        """
+        Connection state with a message cache limited to the announce and temp channels
+        """
+        if BotConfig.message_cache_size is None:
+            return super()._get_state(**options)
+
+        from .messages import TargetedConnectionState
+        return TargetedConnectionState(
+            dispatch=self.dispatch, handlers=self._handlers, hooks=self._hooks, syncer=self._syncer,
+            http=self.http, loop=self.loop, channels=BotConfig.message_channel_ids,
+            size=BotConfig.message_cache_size, **options
+        )
+
     async def get_context(self, message, *, cls=GameContext):
         return await super().get_context(message, cls=cls)
 
+    async def start(self, *args, **kwargs):
+        """
+        Start the metrics endpoint with the bot
+        """
+        if BotConfig.metrics_port is not None and self.metrics_server is None:
+            self.metrics_server = await metrics.serve(BotConfig.metrics_host, BotConfig.metrics_port)
+        await super().start(*args, **kwargs)
+
+    async def invoke(self, ctx: commands.Context):
+        """
+        Time the commands
+        """
+        if ctx.command is None:
+            return await super().invoke(ctx)
+
+        start = time.perf_counter()
+        try:
+            await super().invoke(ctx)
+        finally:
+            metrics.COMMANDS.observe(
+                time.perf_counter() - start,
+                ctx.command.qualified_name,
+                'error' if ctx.command_failed else 'ok'
+            )
+
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        """
+        Time the gateway event listeners
+        """
+        start = time.perf_counter()
+        try:
+            await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            metrics.LISTENERS.observe(time.perf_counter() - start, event_name)
+
+    @staticmethod
+    def _timed_request(request):
+        """
+        Time the REST requests, by route template (the IDs are not in the labels)
+        :param request: HTTPClient.request
+        :return:
+        """
+
+        @functools.wraps(request)
+        async def timed_request(route, **kwargs):
+            start = time.perf_counter()
+            status = 'error'
+            try:
+                result = await request(route, **kwargs)
+                status = '2xx'
+                return result
+            except discord.HTTPException as error:
+                status = str(error.status)
+                raise
+            finally:
+                metrics.REQUESTS.observe(time.perf_counter() - start, route.method, route.path, status)
+
+        return timed_request
+
+    def _watch_members(self) -> None:
+        """
+        Low memory mode: keep the members of the LRU up to date. discord.py drops the gateway updates of the
+        members it does not cache, so its parsers are wrapped (they are called inline, no task by dispatch).
+        :return:
+        """
+        parsers = self._connection.parsers
+        parse_update, parse_remove = parsers['GUILD_MEMBER_UPDATE'], parsers['GUILD_MEMBER_REMOVE']
+
+        def configs(data: dict) -> typing.Iterator[BotConfig]:
+            guild_id = int(data['guild_id'])
+            return (conf for conf in BotConfig.get_all() if conf.guild_id == guild_id)
+
+        @functools.wraps(parse_update)
+        def member_update(data: dict) -> None:
+            parse_update(data)
+            for conf in configs(data):
+                conf.members.update(data)
+
+        @functools.wraps(parse_remove)
+        def member_remove(data: dict) -> None:
+            parse_remove(data)
+            for conf in configs(data):
+                conf.members.discard(int(data['user']['id']))
+
+        parsers['GUILD_MEMBER_UPDATE'] = member_update
+        parsers['GUILD_MEMBER_REMOVE'] = member_remove
+
     def version(self):
         from . import VERSION
 
@@ -50,7 +184,7 @@ class GameBot(commands.Bot):
 
         for ext_name, extention in self.extensions.items():
             if 'VERSION' in dir(extention):
-                print(extention.VERSION)
+                logger.debug("Extension %s version %s", ext_name, extention.VERSION)
                 versions[ext_name] = extention.VERSION
 
         return versions
@@ -75,15 +209,23 @@ class HelpCommand(commands.DefaultHelpCommand):
 
 
 def bot_factory() -> GameBot:
+    member_cache_flags = discord.MemberCacheFlags.from_intents(BotConfig.intents)
+    if BotConfig.member_cache_size is not None:
+        member_cache_flags.joined = False
+
     bot = GameBot(
         command_prefix='.',
         intents=BotConfig.intents,
+        member_cache_flags=member_cache_flags,
+        chunk_guilds_at_startup=BotConfig.member_cache_size is None,
         description='Le bot qui aide pour organiser des soirées jeux !',
         help_command=HelpCommand(),
     )
 
     # Ajouts des Cog
-    bot.load_extension('EventBot.ext.EventManager')
+    from . import EXTENSIONS
+    for extension in EXTENSIONS:
+        bot.load_extension(extension)
 
     @bot.listen()
     async def on_message(message: discord.Message) -> None:
@@ -96,7 +238,7 @@ def bot_factory() -> GameBot:
         if message.guild is not None or message.content.startswith(bot.command_prefix):
             return
 
-        print("Message {0.author} ({0.guild}): {0.content}".format(message))
+        logger.info("Message: %s", message.content, extra={'user': message.author.id, 'sample': True})
         if message.author.id == bot.user.id:
             return
 
@@ -131,13 +273,13 @@ def bot_factory() -> GameBot:
             await ctx.send("Oups ! Je n'ai pas trouvé cet utilisateur...")
         elif isinstance(error, commands.CommandNotFound):
             await ctx.send("Oups ! La commande `{}` n'existe pas...".format(ctx.command))
+        elif isinstance(error, GuildNotConfigured):
+            await ctx.send("Oups ! Ce serveur n'est pas configuré pour les soirées jeux.")
         elif isinstance(error, commands.CheckFailure):
             await ctx.send("Ah non, désolé, je n'ai pas trop envie de t'écouter aujourd'hui...\nLaisse faire les maitres du jeu !")
         else:
-            print("ERROR:")
-            print(error)
-            import traceback
-            traceback.print_exception(type(error), error, error.__traceback__)
+            logger.error("Command %s failed", ctx.command, exc_info=error,
+                         extra={'guild': ctx.guild.id if ctx.guild else None, 'user': ctx.author.id})
 
     @bot.command(
         brief='Lance un dé',
@@ -162,24 +304,45 @@ def bot_factory() -> GameBot:
     )
     async def upgrade(crt: commands.Context) -> None:
         """
-        Upgrade bot
+        Upgrade bot.
+        pip runs in a subprocess so the event loop keeps running, its output is streamed in a message.
+        Extensions are reloaded only if the install succeeded.
         :param crt: Context
         :return:
         """
-        try:
-            from pip import main
-            main(['install', '--upgrade', 'git+https://github.com/bontiv/event-discord-bot.git#egg=DiscordEventBot'])
-        except ImportError:
-            pass
+        message = await crt.send("Mise à jour en cours...")
+        lines = collections.deque(maxlen=UPGRADE_PROGRESS_LINES)
+
+        def progress(title: str) -> str:
+            return "{}\n```\n{}\n```".format(title, "\n".join(lines) or " ")
+
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'pip', 'install', '--upgrade', '--progress-bar', 'off', UPGRADE_SOURCE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        last_edit = bot.loop.time()
+        async for line in process.stdout:
+            lines.append(line.decode(errors='replace').rstrip()[:150])
+            if bot.loop.time() - last_edit >= UPGRADE_PROGRESS_INTERVAL:
+                last_edit = bot.loop.time()
+                await message.edit(content=progress("Mise à jour en cours..."))
+
+        returncode = await process.wait()
+        if returncode != 0:
+            await message.edit(content=progress("Échec de la mise à jour (code {}).".format(returncode)))
+            return
 
         for extension in list(bot.extensions.keys()):
             bot.reload_extension(extension)
+        await message.edit(content=progress("Mise à jour terminée !"))
 
     @bot.command(
         name='version',
         brief='Affiche la version'
     )
     async def version_cmd(ctx: commands.Context):
+        import tabulate
         await ctx.send("```\n" + tabulate.tabulate(ctx.bot.version().items(), headers=['Component', 'Version']) + "```")
 
     return bot
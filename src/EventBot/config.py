@@ -1,7 +1,22 @@
 from discord.ext import commands
+import asyncio
 import discord
+import logging
 import typing
+from datetime import datetime
 from .objects import EventMessage
+from .store import EventStore
+from .index import EventIndex
+from .roles import RoleQueue
+from .members import MemberCache
+
+logger = logging.getLogger(__name__)
+
+
+class GuildNotConfigured(commands.CheckFailure):
+    """
+    A command is used in a guild without configuration
+    """
 
 
 class BotConfig:
@@ -51,6 +66,42 @@ class BotConfig:
         """
         self.voices_chans_ids: typing.Sequence[int] = [843816962760245278, 843816720635527178, 843816832607060028]
 
+        """
+        Is the event store up to date with the announce channel
+        """
+        self.events_synced: bool = False
+
+        """
+        In-memory events of the announce channel
+        """
+        self.events: EventIndex = EventIndex()
+        self._sync_lock = asyncio.Lock()
+
+        """
+        Announces indexed or deleted by the gateway listeners while the history is read (newer than the history)
+        """
+        self._gateway_ids: typing.Set[int] = set()
+
+        """
+        Queue of role changes
+        """
+        self._roles: typing.Optional[RoleQueue] = None
+
+        """
+        Members of the guild (LRU in low memory mode)
+        """
+        self._members: typing.Optional[MemberCache] = None
+
+        """
+        Resolved guild, channels and roles, by ID (invalidated by the gateway listeners)
+        """
+        self._resolved: typing.Dict[int, typing.Any] = {}
+
+        """
+        Rendered pages of .list, by date range (cleared when the events change)
+        """
+        self.list_pages: typing.Dict[typing.Tuple[datetime, datetime], typing.List[str]] = {}
+
     """
     Base permissions
     """
@@ -59,6 +110,7 @@ class BotConfig:
         add_reactions=True,
         manage_roles=True,
         manage_messages=True,
+        manage_channels=True,
         move_members=True
     )
 
@@ -73,23 +125,169 @@ class BotConfig:
         voice_states=True
     )
 
+    """
+    Max number of guilds updated at the same time
+    """
+    update_concurrency: typing.ClassVar[int] = 4
+
+    """
+    Max random delay before the periodic update of a guild (seconds)
+    """
+    update_jitter: typing.ClassVar[float] = 5.0
+
+    """
+    Max number of concurrent role changes in a guild
+    """
+    role_concurrency: typing.ClassVar[int] = 4
+
+    """
+    Temp channel purge strategy at the end of an event: 'bulk', 'clone' or 'auto'
+    """
+    purge_strategy: typing.ClassVar[str] = 'auto'
+
+    """
+    In auto strategy, clone the temp channel when a purge would need more requests than this
+    (None: never clone). A clone changes the channel ID (links and webhooks are lost), its ID is saved
+    in the configuration file.
+    """
+    purge_clone_threshold: typing.ClassVar[typing.Optional[int]] = None
+
+    """
+    Delay to group the stray reactions of an announce before removing them (seconds)
+    """
+    stray_reaction_window: typing.ClassVar[float] = 1.0
+
+    """
+    Quiet period before applying the registration of a user who toggles ✅ (seconds)
+    """
+    reaction_debounce: typing.ClassVar[float] = 1.0
+
+    """
+    Local address of the metrics endpoint (Prometheus text format), no endpoint if the port is None
+    """
+    metrics_host: typing.ClassVar[str] = '127.0.0.1'
+    metrics_port: typing.ClassVar[typing.Optional[int]] = 9120
+
+    """
+    Low memory mode: max number of recently seen members kept by guild. The members are not requested at startup
+    and the members of a role are fetched when needed. None keeps every member of every guild (requested at startup).
+    """
+    member_cache_size: typing.ClassVar[typing.Optional[int]] = None
+
+    """
+    Messages kept by announce and temp channel, the messages of the other channels are not cached.
+    None keeps discord.py's cache of the last messages of every channel.
+    """
+    message_cache_size: typing.ClassVar[typing.Optional[int]] = 100
+
+    """
+    Events by page of .list, and max number of date ranges whose pages are kept
+    """
+    list_page_size: typing.ClassVar[int] = 15
+    list_cache_size: typing.ClassVar[int] = 16
+
+    """
+    Delay between two checks of the configuration file (seconds)
+    """
+    config_poll_interval: typing.ClassVar[float] = 5.0
+
     """
     Bot client ID
     """
     client_id: typing.ClassVar[str] = None
 
+    """
+    Configuration file read by load_file, written again when the bot changes a guild configuration
+    """
+    config_file: typing.ClassVar[typing.Optional[str]] = None
+
     """
     Configuration cache
     """
     _config_cache: typing.ClassVar[typing.Dict[int, 'BotConfig']] = {}
 
+    """
+    Announce and temp channels of all guilds (read for every gateway message, rebuilt when the configurations change)
+    """
+    _message_channel_ids: typing.ClassVar[typing.FrozenSet[int]] = frozenset()
+
+    """
+    Local event store (in memory until a file is opened with open_store)
+    """
+    _event_store: typing.ClassVar[typing.Optional[EventStore]] = None
+
+    def _channel(self, channel_id: int) -> typing.Optional[discord.abc.GuildChannel]:
+        """
+        Resolve a channel, from the cache
+        :param channel_id: Channel ID
+        :return:
+        """
+        channel = self._resolved.get(channel_id)
+        if channel is None:
+            channel = self.bot.get_channel(channel_id)
+            if channel is not None:
+                self._resolved[channel_id] = channel
+        return channel
+
+    def _role(self, role_id: int) -> typing.Optional[discord.Role]:
+        """
+        Resolve a role of the guild, from the cache
+        :param role_id: Role ID
+        :return:
+        """
+        role = self._resolved.get(role_id)
+        if role is None:
+            role = self.guild.get_role(role_id)
+            if role is not None:
+                self._resolved[role_id] = role
+        return role
+
+    def forget(self, *object_ids: int) -> None:
+        """
+        Invalidate resolved objects
+        :param object_ids: Guild, channel or role IDs
+        :return:
+        """
+        for object_id in object_ids:
+            self._resolved.pop(object_id, None)
+
+    @classmethod
+    def forget_everywhere(cls, *object_ids: int) -> None:
+        """
+        Invalidate resolved objects in all configurations
+        :param object_ids: Guild, channel or role IDs
+        :return:
+        """
+        for conf in cls._config_cache.values():
+            conf.forget(*object_ids)
+
+    @classmethod
+    def forget_guild(cls, guild_id: int) -> None:
+        """
+        Invalidate all resolved objects of a guild (its objects are rebuilt when it becomes available)
+        :param guild_id: Guild ID
+        :return:
+        """
+        conf = cls._config_cache.get(guild_id)
+        if conf is not None:
+            conf._resolved.clear()
+
+    @classmethod
+    def forget_all(cls) -> None:
+        """
+        Invalidate all resolved objects (the bot cache is rebuilt on a new gateway session)
+        :return:
+        """
+        for conf in cls._config_cache.values():
+            conf._resolved.clear()
+
     @property
     def temp_channel(self) -> discord.TextChannel:
         """
         Channel use for text discussions inside the event
         :return: TextChannel
         """
-        return self.bot.get_channel(self.temp_channel_id)
+        return self._channel(self.temp_channel_id)
 
     @property
     def guild(self) -> discord.Guild:
@@ -97,7 +295,12 @@ class BotConfig:
         The guild
         :return:
         """
-        return self.bot.get_guild(self.guild_id)
+        guild = self._resolved.get(self.guild_id)
+        if guild is None:
+            guild = self.bot.get_guild(self.guild_id)
+            if guild is not None:
+                self._resolved[self.guild_id] = guild
+        return guild
 
     @property
     def player_role(self) -> discord.Role:
@@ -105,7 +308,7 @@ class BotConfig:
         Dialog Role for event players
         :return:
         """
-        return self.guild.get_role(self.role_id)
+        return self._role(self.role_id)
 
     @property
     def gm_role(self) -> discord.Role:
@@ -113,7 +316,27 @@ class BotConfig:
         Dialog Role for Game Masters
         :return:
         """
-        return self.guild.get_role(self.gm_role_id)
+        return self._role(self.gm_role_id)
+
+    @property
+    def roles(self) -> RoleQueue:
+        """
+        Queue for all role changes of the guild
+        :return:
+        """
+        if self._roles is None:
+            self._roles = RoleQueue(self.bot, self.guild_id, self.role_concurrency, self.members)
+        return self._roles
+
+    @property
+    def members(self) -> MemberCache:
+        """
+        Members of the guild
+        :return:
+        """
+        if self._members is None:
+            self._members = MemberCache(self.bot, self.guild_id, self.member_cache_size)
+        return self._members
 
     @property
     def announce(self) -> discord.TextChannel:
@@ -121,23 +344,175 @@ class BotConfig:
         Channel use for event announcements
         :return:
         """
-        return self.bot.get_channel(self.announce_id)
+        return self._channel(self.announce_id)
+
+    @classmethod
+    def open_store(cls, path: str) -> EventStore:
+        """
+        Open the event store file
+        :param path: SQLite file
+        :return:
+        """
+        if cls._event_store is not None:
+            cls._event_store.close()
+        cls._event_store = EventStore(path)
+        return cls._event_store
+
+    @classmethod
+    def get_store(cls) -> EventStore:
+        """
+        The local event store, shared by all guilds
+        :return:
+        """
+        if BotConfig._event_store is None:
+            BotConfig._event_store = EventStore()
+        return BotConfig._event_store
+
+    @property
+    def store(self) -> EventStore:
+        """
+        The local event store
+        :return:
+        """
+        return self.get_store()
+
+    async def sync_events(self) -> None:
+        """
+        Fill the event index from the announce channel history.
+        The full history is read only the first time. Then the history is read again from the oldest
+        upcoming event: announces edited or deleted while the bot was offline are applied, and the
+        messages posted since the last indexed one are added.
+        After that, the index is kept up to date by the gateway listeners. The announces they change while
+        the history is read are not overwritten by the history.
+        :return:
+        """
+        async with self._sync_lock:
+            if self.events_synced:
+                return
+            self._gateway_ids.clear()
+
+            last_id = self.store.last_message_id(self.guild_id, self.announce_id)
+            stale = set()
+            if last_id is None:
+                history = self.announce.history(limit=None)
+            else:
+                rows = self.store.events(self.guild_id, self.announce_id)
+                after = min([row['message_id'] for row in rows if row['date'] is not None] + [last_id + 1]) - 1
+                stale = {row['message_id'] for row in rows if row['message_id'] > after}
+                history = self.announce.history(limit=None, after=discord.Object(id=after))
+
+            last_id = last_id or 0
+            async for message in history:
+                if message.id not in self._gateway_ids:
+                    self._save_event(EventMessage.from_message(message), commit=False)
+                stale.discard(message.id)
+                last_id = max(last_id, message.id)
+            self.store.mark_filled(self.guild_id, self.announce_id, last_id)
+            stale -= self._gateway_ids
+            self._gateway_ids.clear()
+            if stale:
+                logger.info("%d announces deleted while offline", len(stale), extra={'guild': self.guild_id})
+                self.store.delete(self.guild_id, *stale)
+
+            self.events.clear()
+            for row in self.store.events(self.guild_id, self.announce_id):
+                self.events.put(EventMessage.from_row(row))
+            self.events_synced = True
+        self.events_changed()
+
+    def _save_event(self, event: EventMessage, commit: bool = True) -> None:
+        """
+        Save an event in the store and in the index
+        :param event: The parsed announce
+        :param commit: Commit the store now
+        :return:
+        """
+        self.store.upsert(
+            self.guild_id, self.announce_id, event.id, event.date, event.name, event.games_masters, commit=commit
+        )
+        self.events.put(event)
+
+    def index_message(self, message: discord.Message) -> EventMessage:
+        """
+        Parse an announce and save it in the event index
+        :param message: Announce message
+        :return: The parsed event
+        """
+        event = EventMessage.from_message(message)
+        self._gateway_changed(event.id)
+        self._save_event(event)
+        self.events_changed()
+        return event
 
-    async def get_next_announce(self):
+    def index_content(self, message_id: int, content: str, edited_at: datetime = None) -> EventMessage:
+        """
+        Parse an announce content (from a gateway payload) and save it in the event index
+        :param message_id: Announce message ID
+        :param content: New message content
+        :param edited_at: Edition date of the message
+        :return: The parsed event
+        """
+        event = EventMessage.from_content(message_id, self.announce_id, content, edited_at)
+        self._gateway_changed(event.id)
+        self._save_event(event)
+        self.events_changed()
+        return event
+
+    def forget_messages(self, *message_ids: int) -> None:
+        """
+        Remove deleted announces from the event index
+        :param message_ids: Deleted messages IDs
+        :return:
+        """
+        self._gateway_changed(*message_ids)
+        self.store.delete(self.guild_id, *message_ids)
+        self.events.remove(*message_ids)
+        self.events_changed()
+
+    def _gateway_changed(self, *message_ids: int) -> None:
+        """
+        Record announces changed while the history is read, so the sync keeps their newer state
+        :param message_ids: Messages IDs
+        :return:
+        """
+        if self._sync_lock.locked():
+            self._gateway_ids.update(message_ids)
+
+    def events_changed(self) -> None:
+        """
+        Notify the administration cog that the events of this guild changed
+        :return:
+        """
+        self.list_pages.clear()
+        if self.admin_cog is not None:
+            self.admin_cog.rearm(self)
+
+    async def get_next_announce(self) -> typing.Optional[EventMessage]:
         """
         Get next event (by date)
         :return: The Event Message
         """
-        first_event = None
+        await self.sync_events()
+        return self.events.next_event()
 
-        async for message in self.announce.history():
-            event = EventMessage(self, message)
-            if event.date is None:
-                continue
-            if first_event is None or event.date < first_event.date:
-                first_event = event
+    async def get_events(self, limit: int = None) -> typing.List[EventMessage]:
+        """
+        Get announces, newest first
+        :param limit: Max number of announces, all of them if None
+        :return:
+        """
+        await self.sync_events()
+        return self.events.latest(limit)
 
-        return first_event
+    async def get_events_between(self, begin: datetime, end: datetime) -> typing.List[EventMessage]:
+        """
+        Get events strictly between two dates
+        :param begin: Lower date
+        :param end: Upper date
+        :return:
+        """
+        await self.sync_events()
+        return self.events.between(begin, end)
 
     @property
     def heading(self) -> discord.VoiceChannel:
@@ -145,25 +520,25 @@ class BotConfig:
         Fake voice channel, use for display event as guild title
         :return:
         """
-        return self.bot.get_channel(self.heading_id)
+        return self._channel(self.heading_id)
 
     def general_voice(self) -> discord.VoiceChannel:
         """
         Channel where users are put after event closing
         :return:
         """
-        return self.bot.get_channel(self.general_voice_id)
+        return self._channel(self.general_voice_id)
 
     @property
-    def voices_channels(self) -> typing.Iterable[discord.VoiceChannel]:
+    def voices_channels(self) -> typing.List[discord.VoiceChannel]:
         """
-        Iterable of voices channels for event.
+        Voices channels for event.
         0 - General discussions
         1 - Game 1
         2 - Game 2
         :return:
         """
-        return map(lambda channel_id: self.bot.get_channel(channel_id), self.voices_chans_ids)
+        return [self._channel(channel_id) for channel_id in self.voices_chans_ids]
 
     def voice_channel(self, index) -> discord.VoiceChannel:
         """
@@ -171,7 +546,7 @@ class BotConfig:
         :param index: 0 - general, 1 - game 1, 2 - game 2
         :return:
         """
-        return self.bot.get_channel(self.voices_chans_ids[index])
+        return self._channel(self.voices_chans_ids[index])
 
     @property
     def reactions_cog(self) -> 'ReactionManager':
@@ -190,25 +565,59 @@ class BotConfig:
         return self.bot.get_cog('admin')
 
     @classmethod
-    def from_context(cls, ctx: commands.Context) -> 'BotConfig':
+    def from_context(cls, ctx: commands.Context) -> typing.Optional['BotConfig']:
         """
         Get the configuration from context
         :param ctx: Context to parse
-        :return:
+        :return: None if the guild is not configured
         """
         return cls.from_guild_id(ctx.bot, ctx.guild.id)
 
     @classmethod
-    def from_guild_id(cls, bot: commands.Bot, guild_id: int):
+    def require(cls, ctx: commands.Context) -> 'BotConfig':
+        """
+        Get the configuration from context, for the commands which need one
+        :param ctx: Context to parse
+        :return: Guild configuration
+        :raise GuildNotConfigured: The guild is not configured
+        """
+        conf = cls.from_context(ctx)
+        if conf is None:
+            raise GuildNotConfigured()
+        return conf
+
+    @classmethod
+    def from_guild_id(cls, bot: commands.Bot, guild_id: int) -> typing.Optional['BotConfig']:
         """
         Get the configuration from Bot agent and guild ID
         :param bot: Got agent
         :param guild_id: Guild ID to fetch
+        :return: None if the guild is not configured
+        """
+        return cls._config_cache.get(guild_id)
+
+    @classmethod
+    def register(cls, conf: 'BotConfig') -> 'BotConfig':
+        """
+        Add a guild configuration in the cache (replacing the configuration of the same guild)
+        :param conf: The configuration
         :return:
         """
-        if guild_id not in cls._config_cache:
-            cls._config_cache[guild_id] = BotConfig(bot)
-        return cls._config_cache[guild_id]
+        cls._config_cache[conf.guild_id] = conf
+        cls.channels_changed()
+        return conf
+
+    @classmethod
+    def from_announce_id(cls, channel_id: int) -> typing.Optional['BotConfig']:
+        """
+        Get the configuration owning an announce channel
+        :param channel_id: Channel ID
+        :return: The configuration, None if the channel is not an announce channel
+        """
+        for conf in cls._config_cache.values():
+            if conf.announce_id == channel_id:
+                return conf
+        return None
 
     @classmethod
     def get_all(cls) -> typing.Iterable['BotConfig']:
@@ -219,35 +628,160 @@ class BotConfig:
         return cls._config_cache.values()
 
     @classmethod
-    def load_file(cls, file: str) -> str:
+    def message_channel_ids(cls) -> typing.FrozenSet[int]:
+        """
+        Channels whose messages are cached: announce and temp channels of all guilds
+        :return:
+        """
+        return cls._message_channel_ids
+
+    @classmethod
+    def channels_changed(cls) -> None:
+        """
+        Rebuild the set of the channels whose messages are cached, after a configuration change
+        :return:
+        """
+        cls._message_channel_ids = frozenset(
+            channel_id for conf in cls._config_cache.values() for channel_id in (conf.announce_id, conf.temp_channel_id)
+        )
+
+    @classmethod
+    def from_section(cls, bot: commands.Bot, section: typing.Mapping[str, str]) -> 'BotConfig':
+        """
+        Build a guild configuration from a section of the configuration file
+        :param bot: Bot agent
+        :param section: Section written by save_file (missing keys keep the default value)
+        :return:
+        """
+        conf = cls(bot)
+        conf.guild_id = int(section.get('guild', conf.guild_id))
+        conf.temp_channel_id = int(section.get('temp-channel', conf.temp_channel_id))
+        conf.role_id = int(section.get('player_role', conf.role_id))
+        conf.gm_role_id = int(section.get('gm_role', conf.gm_role_id))
+        conf.announce_id = int(section.get('announce-channel', conf.announce_id))
+        conf.heading_id = int(section.get('heading-channel', conf.heading_id))
+        conf.general_voice_id = int(section.get('general-voice', conf.general_voice_id))
+        if 'voice-channels' in section:
+            conf.voices_chans_ids = [int(channel_id) for channel_id in section['voice-channels'].split(",") if channel_id]
+        return conf
+
+    def adopt(self, previous: 'BotConfig') -> None:
+        """
+        Take the runtime state of the configuration replaced by this one.
+        The event index is kept only if the announce channel did not change.
+        :param previous: Replaced configuration
+        :return:
         """
-        Load cache from configuration file
+        self._roles = previous._roles
+        self._members = previous._members
+        if previous.announce_id == self.announce_id:
+            self.events = previous.events
+            self.events_synced = previous.events_synced
+            self._sync_lock = previous._sync_lock
+
+    @classmethod
+    def load_file(cls, file: str, bot: commands.Bot = None) -> str:
+        """
+        Load cache from configuration file.
+        All guild sections are read before any of them is applied, then the cache is replaced in one step,
+        so a broken file changes nothing. The guilds whose section was removed are dropped.
+        A file without guild section configures the default guild.
         :param file: filename to load
+        :param bot: Bot agent, guild sections are ignored without it
         :return: The client secret for this Bot
         """
-        from configparser import ConfigParser
-        config = ConfigParser()
-        config.read(file, encoding='utf-8-sig')
+        from .metadata import read_config
+        config = read_config(file)
 
-        for section in config.sections():
-            # todo: load guild configuration
-            pass
+        configs = {}
+        if bot is not None:
+            for section in config.sections():
+                conf = cls.from_section(bot, config[section])
+                configs[conf.guild_id] = conf
+            if not configs:
+                conf = cls(bot)
+                configs[conf.guild_id] = conf
 
         cls.client_id = config['DEFAULT']['client']
+        cls.config_file = file
+        if bot is not None:
+            cls._replace_all(bot, configs)
         return config['DEFAULT']['secret'] if 'secret' in config['DEFAULT'] else None
 
+    @classmethod
+    def _replace_all(cls, bot: commands.Bot, configs: typing.Dict[int, 'BotConfig']) -> None:
+        """
+        Replace the configuration cache. The new configurations take the runtime state of the previous ones,
+        the events of the removed guilds are no longer watched.
+        :param bot: Bot agent
+        :param configs: New configurations, by guild ID
+        :return:
+        """
+        for guild_id, conf in configs.items():
+            previous = cls._config_cache.get(guild_id)
+            if previous is not None:
+                conf.adopt(previous)
+        removed = [conf for guild_id, conf in cls._config_cache.items() if guild_id not in configs]
+        cls._config_cache = configs
+        cls.channels_changed()
+
+        for conf in removed:
+            logger.info("Guild configuration removed", extra={'guild': conf.guild_id})
+            if conf.reactions_cog is not None:
+                conf.reactions_cog.unwatch_guild(conf.guild_id)
+            if conf.admin_cog is not None:
+                conf.admin_cog.scheduler.arm(conf.guild_id, None)
+
+        for conf in configs.values():
+            if bot.is_ready() and not conf.events_synced:
+                bot.loop.create_task(conf.sync_events())
+            conf.events_changed()
+
+    @classmethod
+    async def watch_file(cls, bot: commands.Bot, file: str) -> None:
+        """
+        Reload the configuration file when it changes
+        :param bot: Bot agent
+        :param file: Configuration file
+        :return:
+        """
+        import os
+
+        def signature():
+            try:
+                stat = os.stat(file)
+            except OSError:
+                return None
+            return stat.st_mtime_ns, stat.st_size
+
+        last = signature()
+        while True:
+            await asyncio.sleep(cls.config_poll_interval)
+            current = signature()
+            if current is None or current == last:
+                continue
+            last = current
+            try:
+                cls.load_file(file, bot)
+            except Exception as error:
+                logger.error("Configuration reload failed, previous configuration kept", exc_info=error)
+            else:
+                logger.info("Configuration reloaded")
+
     @classmethod
     def save_file(cls, file: str):
         """
-        Save configuration in a file
+        Save configuration in a file.
+        The other settings of the DEFAULT section (client secret) are kept, the guild sections are replaced.
         :param file: File to write
         :return:
         """
-        from configparser import ConfigParser
-        config = ConfigParser()
-        config['DEFAULT'] = {
-            'client': cls.client_id,
-        }
+        from .metadata import read_config
+        config = read_config(file)
+        for section in config.sections():
+            config.remove_section(section)
+        if cls.client_id is not None:
+            config['DEFAULT']['client'] = cls.client_id
 
         for guild_id in cls._config_cache:
             gconf: BotConfig = cls._config_cache[guild_id]
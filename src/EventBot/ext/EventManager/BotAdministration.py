@@ -1,9 +1,25 @@
 from .helpers import reset_game
+from .scheduler import EventScheduler, heading_name
+from .supervisor import UpdateSupervisor
+from . import handoff
+from EventBot import metrics
 from EventBot.config import BotConfig
 from EventBot.objects import EventMessage
 from discord.ext import commands, tasks
 from datetime import datetime
-import asyncio, discord, typing
+import asyncio, discord, functools, logging, typing
+
+logger = logging.getLogger(__name__)
+
+"""
+Max number of lines by table of .stats
+"""
+STATS_TOP_MAX = 25
+
+"""
+Max length of a message (Discord limit)
+"""
+MESSAGE_MAX_LENGTH = 2000
 
 
 class BotManagementCog(commands.Cog, description='Gestion du bot (commande admins)', name='admin'):
@@ -12,10 +28,171 @@ class BotManagementCog(commands.Cog, description='Gestion du bot (commande admin
     """
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.scheduler = EventScheduler(self.on_deadline)
+        self.supervisor = UpdateSupervisor(BotConfig.update_concurrency, BotConfig.update_jitter)
+        self.scheduler_task = bot.loop.create_task(self.run_scheduler())
+
+        """
+        Date of the first periodic update, when the cog takes over from a reloaded one
+        """
+        self.resume_at: typing.Optional[datetime] = None
         self.update_task.start()
 
     def cog_unload(self):
+        handoff.export(self)
         self.update_task.cancel()
+        self.scheduler_task.cancel()
+
+    def export_state(self) -> dict:
+        """
+        State given to the next instance on a reload
+        :return:
+        """
+        return {
+            'scheduler': self.scheduler.export_state(),
+            'supervisor': self.supervisor.states,
+            'next_update': self.update_task.next_iteration,
+        }
+
+    def import_state(self, state: dict) -> None:
+        """
+        Take over the state of a reloaded instance
+        :param state: Exported state
+        :return:
+        """
+        self.scheduler.import_state(state['scheduler'])
+        self.supervisor.states = state['supervisor']
+        if state['next_update'] is not None:
+            self.resume_at = state['next_update']
+
+    @commands.Cog.listener()
+    async def on_ready(self) -> None:
+        """
+        A new gateway session rebuilt the bot cache: forget the resolved objects and the members of the
+        fetched roles (member updates may have been missed)
+        :return:
+        """
+        BotConfig.forget_all()
+        for conf in BotConfig.get_all():
+            conf.members.forget_roles()
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild) -> None:
+        """
+        Forget the resolved objects and the members of the fetched roles of a guild rebuilt by the gateway
+        :param guild: The guild
+        :return:
+        """
+        BotConfig.forget_guild(guild.id)
+        for conf in BotConfig.get_all():
+            if conf.guild_id == guild.id:
+                conf.members.forget_roles()
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild) -> None:
+        """
+        Forget the resolved objects of a guild rebuilt by the gateway
+        :param guild: The guild
+        :return:
+        """
+        BotConfig.forget_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        """
+        Forget the resolved objects of a guild left or unavailable
+        :param guild: The guild
+        :return:
+        """
+        BotConfig.forget_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_unavailable(self, guild: discord.Guild) -> None:
+        """
+        Forget the resolved objects of a guild left or unavailable
+        :param guild: The guild
+        :return:
+        """
+        BotConfig.forget_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel) -> None:
+        """
+        Forget a resolved channel when it changes
+        :param before: Channel before the update
+        :param after: Channel after the update
+        :return:
+        """
+        BotConfig.forget_everywhere(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
+        """
+        Forget a deleted channel
+        :param channel: The channel
+        :return:
+        """
+        BotConfig.forget_everywhere(channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        """
+        Forget a resolved role when it changes
+        :param before: Role before the update
+        :param after: Role after the update
+        :return:
+        """
+        BotConfig.forget_everywhere(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        """
+        Forget a deleted role
+        :param role: The role
+        :return:
+        """
+        BotConfig.forget_everywhere(role.id)
+
+    async def run_scheduler(self) -> None:
+        """
+        Run the event scheduler once the bot is ready
+        :return:
+        """
+        await self.bot.wait_until_ready()
+        await self.scheduler.run()
+
+    def rearm(self, conf: BotConfig) -> None:
+        """
+        Schedule the transitions of the next event of a guild
+        :param conf: Guild configuration
+        :return:
+        """
+        self.scheduler.arm(conf.guild_id, conf.events.next_event())
+
+    async def on_deadline(self, guild_id: int) -> None:
+        """
+        A transition of the next event is reached
+        :param guild_id: Guild ID
+        :return:
+        """
+        conf = BotConfig.from_guild_id(self.bot, guild_id)
+        if conf is None:
+            return
+        try:
+            await self.supervisor.run(guild_id, functools.partial(self.run_update, conf), periodic=False)
+        finally:
+            self.rearm(conf)
+
+    async def run_update(self, conf: BotConfig) -> None:
+        """
+        Update a guild and wait for all side effects
+        :param conf: Guild configuration
+        :return:
+        """
+        event, tasks = await self.update(conf)
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                raise result
 
     @commands.command(
         name='open',
@@ -32,7 +209,7 @@ class BotManagementCog(commands.Cog, description='Gestion du bot (commande admin
         conf = BotConfig.from_context(ctx)
         message_discord = await conf.announce.fetch_message(message)
 
-        await conf.reactions_cog.set_message(message_discord)
+        await conf.reactions_cog.watch(message_discord)
 
     @commands.command(
         name='announce',
@@ -55,8 +232,8 @@ class BotManagementCog(commands.Cog, description='Gestion du bot (commande admin
         await asyncio.gather(
             message.add_reaction("✅"),
             conf.heading.edit(name=dt_value.strftime("📅Soirée %d/%m à %H:%M")),
-            conf.reactions_cog.set_message(message),
-            ctx.author.add_roles(conf.gm_role)
+            conf.reactions_cog.watch(message),
+            conf.roles.add(ctx.author.id, conf.gm_role)
         )
 
     @staticmethod
@@ -89,7 +266,7 @@ class BotManagementCog(commands.Cog, description='Gestion du bot (commande admin
         event, tasks = await self.update(conf)
         if event is None:
             tasks.append(ctx.send("Pas de soirée à venir"))
-        elif event.is_open:
+        elif event.is_open(conf):
             tasks.append(ctx.send("Prochaine soirée le {}. L'événement est ouvert. Fermeture {}.".format(
                 event.date.strftime("%d/%m à %H:%M"),
                 event.close_date.strftime("%d/%m à %H:%M")
@@ -102,25 +279,93 @@ class BotManagementCog(commands.Cog, description='Gestion du bot (commande admin
 
         await asyncio.gather(*tasks)
 
-    @tasks.loop(minutes=10)
+    @commands.command(
+        name='reindex',
+        brief='Relit tout le salon des annonces',
+        description="Reconstruit l'index local des événements depuis l'historique du salon des annonces",
+    )
+    async def reindex_cmd(self, ctx: commands.Context) -> None:
+        """
+        Rebuild the event store from the announce channel history
+        :param ctx: Context
+        :return:
+        """
+        conf = BotConfig.from_context(ctx)
+        conf.store.forget_channel(conf.guild_id, conf.announce_id)
+        conf.events_synced = False
+        await conf.sync_events()
+        await ctx.send("Index des événements reconstruit.")
+
+    @commands.command(
+        name='stats',
+        brief='Statistiques du bot',
+        description='Affiche les commandes, événements, requêtes et mises à jour les plus fréquents avec leur durée',
+    )
+    async def stats_cmd(self, ctx: commands.Context, top: int = 8) -> None:
+        """
+        Show the busiest commands, gateway listeners and REST routes, and the guild updates
+        :param ctx: Context
+        :param top: Number of lines by table (at most STATS_TOP_MAX)
+        :return:
+        """
+        import tabulate
+
+        top = max(1, min(top, STATS_TOP_MAX))
+
+        def table(histogram, headers, extra=None) -> str:
+            rows = []
+            for labels in sorted(histogram.values, key=lambda labels: -histogram.count(*labels))[:top]:
+                count = histogram.count(*labels)
+                rows.append(list(labels) + [
+                    count,
+                    "{:.0f}".format(histogram.sum(*labels) * 1000 / count),
+                    "{:g}".format(histogram.quantile(0.95, *labels) * 1000),
+                ] + ([extra(labels)] if extra else []))
+            return tabulate.tabulate(rows, headers=headers + ['Nb', 'Moy. ms', 'p95 ms'] + (['429'] if extra else []))
+
+        def rate_limited(labels) -> str:
+            route = labels[1]
+            return "{:g} ({:.1f} s)".format(
+                metrics.RATE_LIMITS.values.get((route, 'bucket'), 0),
+                metrics.RETRY_AFTER.values.get((route,), 0)
+            )
+
+        async def send(text: str) -> None:
+            # Long tables are split by lines, each message stays under the Discord limit
+            block = []
+            for line in text.splitlines():
+                if block and len("\n".join(block + [line])) + 8 > MESSAGE_MAX_LENGTH:
+                    await ctx.send("```\n{}\n```".format("\n".join(block)))
+                    block = []
+                block.append(line[:MESSAGE_MAX_LENGTH - 8])
+            await ctx.send("```\n{}\n```".format("\n".join(block)))
+
+        await send(table(metrics.COMMANDS, ['Commande', 'Statut']))
+        await send(table(metrics.LISTENERS, ['Événement']))
+        await send(table(metrics.REQUESTS, ['Méthode', 'Route', 'Statut'], rate_limited))
+        await send(table(metrics.GUILD_UPDATES, ['Serveur', 'Statut']))
+
+    @tasks.loop(hours=1)
     async def update_task(self):
         """
-        Task to automate open and close events
+        Safety net of the scheduler: update all guilds from time to time
         :return:
         """
-        tasks_all = []
-        for conf in BotConfig.get_all():
-            event, tasks = await self.update(conf)
-            tasks_all += tasks
-        await asyncio.gather(*tasks_all, return_exceptions=True)
+        await asyncio.gather(*[
+            self.supervisor.run(conf.guild_id, functools.partial(self.run_update, conf))
+            for conf in BotConfig.get_all()
+        ])
 
     @update_task.before_loop
     async def before_update_task(self):
         """
-        Wait for bot ready before start update loop
+        Wait for bot ready before start update loop.
+        After a reload, the first update waits for the date planned by the previous instance.
         :return:
         """
         await self.bot.wait_until_ready()
+        if self.resume_at is not None:
+            await discord.utils.sleep_until(self.resume_at)
 
     @staticmethod
     async def update(conf: BotConfig) -> typing.Tuple[EventMessage, typing.List[typing.Coroutine]]:
@@ -130,45 +375,43 @@ class BotManagementCog(commands.Cog, description='Gestion du bot (commande admin
         :return:
         """
         next_event = await conf.get_next_announce()
+        await conf.reactions_cog.restored.wait()
         tasks = []
-        heading = conf.heading.name
+        heading = heading_name(next_event, datetime.now())
 
         if next_event is None:
-            heading = "📅Pas de soirée à venir"
-            tasks.append(conf.reactions_cog.set_message(None))
+            conf.reactions_cog.unwatch_guild(conf.guild_id)
 
-        elif next_event.can_close and next_event.is_open:
-            print("Close event")
+        elif next_event.can_close and next_event.is_open(conf):
+            logger.info("Close event", extra={'guild': conf.guild_id, 'event': next_event.id})
             tasks.append(reset_game(conf))
 
-        elif next_event.can_open and not next_event.is_open:
-            tasks.append(conf.reactions_cog.set_message(next_event.message))
+        elif next_event.can_open and not next_event.is_open(conf):
+            tasks.append(BotManagementCog.open_event(conf, next_event))
             for gm in next_event.games_masters:
-                member = conf.guild.get_member(gm)
-                if member is None:
-                    member = await conf.guild.fetch_member(gm)
-                if member is not None:
-                    tasks.append(member.add_roles(conf.gm_role))
-            print("Open event")
-
-        if next_event is not None:
-            if next_event.date > datetime.now():
-                diff_dates = next_event.date - datetime.now()
-                if diff_dates.days == 0:
-                    heading = next_event.date.strftime("📅Aujourd'hui à %H:%M")
-                elif diff_dates.days == 1:
-                    heading = next_event.date.strftime("📅Demain à %H:%M")
-                else:
-                    heading = next_event.date.strftime("📅Soirée %d/%m à %H:%M")
-            else:
-                heading = next_event.date.strftime("📅Événement en cours")
+                tasks.append(conf.roles.add(gm, conf.gm_role))
+            logger.info("Open event", extra={'guild': conf.guild_id, 'event': next_event.id})
 
         if heading != conf.heading.name:
-            print("Current Name: {}\nNext Name: {}".format(conf.heading.name, heading))
+            logger.info("Heading renamed from %r to %r", conf.heading.name, heading, extra={'guild': conf.guild_id})
             tasks.append(conf.heading.edit(name=heading, reason="Bot update next event."))
 
         return next_event, tasks
 
+    @staticmethod
+    async def open_event(conf: BotConfig, event: EventMessage) -> None:
+        """
+        Open an event, the event is forgotten when its announce was deleted
+        :param conf: Guild configuration
+        :param event: The event
+        :return:
+        """
+        try:
+            await event.open(conf)
+        except discord.NotFound:
+            logger.warning("Announce deleted, event forgotten", extra={'guild': conf.guild_id, 'event': event.id})
+            conf.forget_messages(event.id)
+
     async def cog_check(self, ctx: commands.Context) -> bool:
         """
         Check if author is bot administrator
@@ -177,4 +420,6 @@ class BotManagementCog(commands.Cog, description='Gestion du bot (commande admin
         """
         if ctx.guild is None:
             return False
+        if ctx.command is not self.stats_cmd:
+            BotConfig.require(ctx)
         return ctx.author.guild_permissions.administrator
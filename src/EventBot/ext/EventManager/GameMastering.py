@@ -30,7 +30,7 @@ class GameMasterCog(commands.Cog, name='Maitre du jeu'):
         max_dice = 0
         message = []
         win_player = None
-        for user in conf.player_role.members:
+        for user in await conf.members.role_members(conf.player_role):
             dice = random.randint(1, max_value)
             if dice > max_dice:
                 max_dice = dice
@@ -51,10 +51,10 @@ class GameMasterCog(commands.Cog, name='Maitre du jeu'):
         :return:
         """
         conf = BotConfig.from_context(ctx)
-        conf.reactions_cog.ban_member(user.id)
+        conf.reactions_cog.ban_member(conf.guild_id, user.id)
 
         await asyncio.gather(
-            user.remove_roles(conf.player_role),
+            conf.roles.remove(user.id, conf.player_role),
             user.move_to(None)
         )
 
@@ -71,15 +71,12 @@ class GameMasterCog(commands.Cog, name='Maitre du jeu'):
         :return:
         """
         conf = BotConfig.from_context(crx)
-        players = []
+        players = list(await conf.members.role_members(conf.player_role))
 
-        if len(conf.player_role.members) == 0:
+        if len(players) == 0:
             await crx.send("Oups ! Pas assez de monde pour faire des équipes...")
             return
 
-        for member in conf.player_role.members:
-            players.append(member)
-
         import random
         random.shuffle(players)
 
@@ -189,7 +186,7 @@ class GameMasterCog(commands.Cog, name='Maitre du jeu'):
         :return:
         """
         conf = BotConfig.from_context(ctx)
-        await user.add_roles(conf.gm_role)
+        await conf.roles.add(user.id, conf.gm_role)
 
     @gm.command(
         name='remove',
@@ -203,7 +200,7 @@ class GameMasterCog(commands.Cog, name='Maitre du jeu'):
         :return:
         """
         conf = BotConfig.from_context(ctx)
-        await user.remove_roles(conf.gm_role)
+        await conf.roles.remove(user.id, conf.gm_role)
 
     @commands.command(
         name='close',
@@ -224,10 +221,10 @@ class GameMasterCog(commands.Cog, name='Maitre du jeu'):
         """
         if ctx.guild is None:
             return False
+        conf = BotConfig.require(ctx)
         if ctx.author.id == 364004307550601218:
             return True
 
-        conf = BotConfig.from_context(ctx)
         if conf.gm_role in ctx.author.roles:
             return True
         return False
@@ -5,38 +5,198 @@ from datetime import datetime, timedelta
 from .errors import DateNotAvailable
 import discord
 import asyncio
+import logging
+import typing
+
+logger = logging.getLogger(__name__)
+
+"""
+Max length of an event name in .list (a message is limited to 2000 characters)
+"""
+LIST_NAME_WIDTH = 40
+
+
+def shorten(text: str, width: int) -> str:
+    """
+    Cut a text to a max length
+    :param text: The text
+    :param width: Max length
+    :return:
+    """
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+
+def day_range(begin: typing.Optional[str], end: typing.Optional[str],
+              now: datetime) -> typing.Tuple[datetime, datetime]:
+    """
+    Date range of whole days given as JJ/MM, in the current year.
+    The last day is in the next year when it is before the first one.
+    :param begin: First day, today if None
+    :param end: Last day, no limit if None
+    :param now: Current date
+    :return: (start of the first day, end of the last day)
+    """
+    if begin is None:
+        first = datetime.combine(now.date(), datetime.min.time())
+    else:
+        first = datetime.strptime("{}/{}".format(begin, now.year), "%d/%m/%Y")
+    if end is None:
+        return first, datetime.max
+
+    last = datetime.strptime("{}/{}".format(end, first.year), "%d/%m/%Y")
+    if last < first:
+        last = datetime.strptime("{}/{}".format(end, first.year + 1), "%d/%m/%Y")
+    return first, last + timedelta(days=1)
+
+
+def event_date(date: str, time: str, now: datetime) -> datetime:
+    """
+    Date of a new event given as JJ/MM and HH:MM, in the current year or in the next one if it is already passed
+    :param date: Day (JJ/MM)
+    :param time: Time (HH:MM)
+    :param now: Current date
+    :return:
+    """
+    value = datetime.strptime("{}/{} {}".format(date, now.year, time), "%d/%m/%Y %H:%M")
+    if value < now:
+        value = datetime.strptime("{}/{} {}".format(date, now.year + 1, time), "%d/%m/%Y %H:%M")
+    return value
+
 
 class EventManagementCog(commands.Cog, name='Plannification'):
     """
     Event planner
     """
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_ready(self) -> None:
+        """
+        Seed the event index of each guild.
+        On a reconnection, the history is read again from the oldest upcoming event: the announces posted,
+        edited or deleted while disconnected are applied.
+        :return:
+        """
+        for conf in BotConfig.get_all():
+            conf.events_synced = False
+        await asyncio.gather(*[conf.sync_events() for conf in BotConfig.get_all()], return_exceptions=True)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message) -> None:
+        """
+        Index new announces (also while the history is read, the sync keeps them)
+        :param message: Message received
+        :return:
+        """
+        conf = BotConfig.from_announce_id(message.channel.id)
+        if conf is not None:
+            conf.index_message(message)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+        """
+        Index edited announces, from the payload content (no fetch)
+        :param payload: The raw payload
+        :return:
+        """
+        conf = BotConfig.from_announce_id(payload.channel_id)
+        if conf is not None and 'content' in payload.data:
+            conf.index_content(
+                payload.message_id,
+                payload.data['content'],
+                discord.utils.parse_time(payload.data.get('edited_timestamp'))
+            )
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent) -> None:
+        """
+        Remove deleted announces from the index
+        :param payload: The raw payload
+        :return:
+        """
+        conf = BotConfig.from_announce_id(payload.channel_id)
+        if conf is not None:
+            conf.forget_messages(payload.message_id)
+            conf.reactions_cog.unwatch(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent) -> None:
+        """
+        Remove deleted announces from the index
+        :param payload: The raw payload
+        :return:
+        """
+        conf = BotConfig.from_announce_id(payload.channel_id)
+        if conf is not None:
+            conf.forget_messages(*payload.message_ids)
+            for message_id in payload.message_ids:
+                conf.reactions_cog.unwatch(message_id)
 
     @commands.command(
         brief="Liste les soirées",
-        description='Liste toutes les soirées à venir, géré par moi.',
+        description="Liste les soirées à venir, par pages.\n"
+                    "Une période peut être donnée avec les dates de début et de fin au format JJ/MM.",
+        usage="[page] [début] [fin]"
     )
-    async def list(self, ctx: commands.Context) -> None:
+    async def list(self, ctx: commands.Context, page: typing.Optional[int] = 1,
+                   begin: str = None, end: str = None) -> None:
         """
-        Send back to user the list of events
+        Send back to user a page of the list of events
         :param ctx: Context
+        :param page: Page number
+        :param begin: First day (JJ/MM), today by default
+        :param end: Last day (JJ/MM), no limit by default
         :return:
         """
-        import tabulate
-        all_events = []
         conf = BotConfig.from_context(ctx)
+        try:
+            first, last = day_range(begin, end, datetime.now())
+        except ValueError:
+            await ctx.send("Le format de la date n'est pas respectée.")
+            return
+
+        pages = await self.list_pages(conf, first, last)
+        if not pages:
+            await ctx.send("Aucune soirée sur cette période.")
+            return
+        if not 1 <= page <= len(pages):
+            await ctx.send("Oups ! Il n'y a que {} page(s).".format(len(pages)))
+            return
+
+        footer = "Page {}/{}".format(page, len(pages))
+        if page < len(pages):
+            footer += " - suite avec .list {}".format(" ".join(filter(None, [str(page + 1), begin, end])))
+        await ctx.send("Liste des événements :\n```\n{}\n```\n{}".format(pages[page - 1], footer))
+
+    @staticmethod
+    async def list_pages(conf: BotConfig, begin: datetime, end: datetime) -> typing.List[str]:
+        """
+        Rendered pages of the events between two dates, from the cache of the guild
+        :param conf: Guild configuration
+        :param begin: Lower date
+        :param end: Upper date
+        :return:
+        """
+        import tabulate
 
-        async for message in conf.announce.history():
-            event = EventMessage(conf, message)
-            all_events.append([
-                event.id,
-                event.date.strftime("%d/%m - %H:%M") if event.date is not None else "-",
-                event.name
-            ])
+        key = (begin, end)
+        pages = conf.list_pages.get(key)
+        if pages is not None:
+            return pages
 
-        await ctx.send("Liste des événements :\n```\n" + tabulate.tabulate(
-            all_events,
-            headers=['ID', 'Date', 'Nom']
-        ) + "\n```\n")
+        rows = [
+            [event.id, event.date.strftime("%d/%m/%Y - %H:%M"), shorten(event.name, LIST_NAME_WIDTH)]
+            for event in await conf.get_events_between(begin, end)
+        ]
+        pages = [
+            tabulate.tabulate(rows[start:start + conf.list_page_size], headers=['ID', 'Date', 'Nom'])
+            for start in range(0, len(rows), conf.list_page_size)
+        ]
+        while len(conf.list_pages) >= conf.list_cache_size:
+            conf.list_pages.pop(next(iter(conf.list_pages)))
+        conf.list_pages[key] = pages
+        return pages
 
     @commands.command(
         brief='Planifie une soirée',
@@ -52,19 +212,15 @@ class EventManagementCog(commands.Cog, name='Plannification'):
         :return:
         """
         try:
-            dt_value = datetime.strptime("{} {}".format(date, time), "%d/%m %H:%M")
+            dt_value = event_date(date, time, datetime.now())
             conf = BotConfig.from_context(ctx)
 
             begin = dt_value - timedelta(hours=4)
             end = dt_value + timedelta(hours=4)
 
-            async for announce in conf.announce.history():
-                event = EventMessage(conf, announce)
-                if event.date is None:
-                    continue
-                print(event.date)
-                if begin < event.date < end:
-                    raise DateNotAvailable(dt_value, event)
+            for event in await conf.get_events_between(begin, end):
+                logger.info("Date conflict with %s", event.date, extra={'guild': conf.guild_id, 'event': event.id})
+                raise DateNotAvailable(dt_value, event)
 
             await ctx.send("Ajout d'un event le {}: {}".format(dt_value.strftime("%d/%m à %H h %M"), name))
             message = await conf.announce.send(
@@ -121,7 +277,7 @@ class EventManagementCog(commands.Cog, name='Plannification'):
         try:
             await self.delete(ctx, event)
             conf = BotConfig.from_context(ctx)
-            (event, tasks) = await conf.admin_cog.update(ctx)
+            (event, tasks) = await conf.admin_cog.update(conf)
             await asyncio.gather(*tasks)
 
         except discord.NotFound:
@@ -139,23 +295,26 @@ class EventManagementCog(commands.Cog, name='Plannification'):
         """
         conf = BotConfig.from_context(ctx)
         message = await conf.announce.fetch_message(event_id)
-        event = EventMessage(conf, message)
+        event = EventMessage.from_message(message)
         if event.date is None:
-            print("DELETE: Event sans date")
+            logger.info("Delete refused: event without date", extra={'guild': conf.guild_id, 'event': event.id})
             raise commands.CheckFailure(message="Event without date.")
 
         if not ctx.author.guild_permissions.administrator and ctx.author.id not in event.games_masters:
-            print("DELETE: Cannot delete.")
-            print(event.games_masters)
-            print(ctx.author.id)
+            logger.info("Delete refused: not a games master (%s)", event.games_masters,
+                        extra={'guild': conf.guild_id, 'event': event.id, 'user': ctx.author.id})
             raise commands.CheckFailure(message="Forbidden")
 
         await message.delete()
+        conf.forget_messages(message.id)
 
     async def cog_check(self, ctx: commands.Context):
         """
-        Cog only available in guild context
+        Cog only available in configured guild context
         :param ctx: Context
         :return:
         """
-        return ctx.guild is not None
+        if ctx.guild is None:
+            return False
+        BotConfig.require(ctx)
+        return True
@@ -1,21 +1,263 @@
 from discord.ext import commands
+from EventBot import metrics
 from EventBot.config import BotConfig
-import discord, asyncio, typing
+from . import handoff
+import discord, asyncio, logging, typing
+
+logger = logging.getLogger(__name__)
+
+
+class WatchedEvent:
+    """
+    An open event: the announce message watched for registrations
+    """
+
+    def __init__(self, message: discord.Message, player_role_id: int):
+        self.message = message
+        self.guild_id: int = message.guild.id
+        self.channel_id: int = message.channel.id
+
+        """
+        Player role when the event was opened (a configuration reload does not change it for this event)
+        """
+        self.player_role_id = player_role_id
+
+        """
+        Members with a ✅ reaction (banned members included)
+        """
+        self.reacted: typing.Set[int] = set()
+
+        """
+        Members kicked from this event
+        """
+        self.banned: typing.Set[int] = set()
+
+    @property
+    def id(self) -> int:
+        return self.message.id
+
+    @property
+    def participants(self) -> typing.Set[int]:
+        """
+        Members registered (✅ reaction and not banned)
+        :return:
+        """
+        return self.reacted - self.banned
+
+    def is_participant(self, user_id: int) -> bool:
+        """
+        Is a user registered in this event
+        :param user_id: User ID
+        :return:
+        """
+        return user_id in self.reacted and user_id not in self.banned
+
+
+class ReconcileReport:
+    """
+    Operations of a registrations reconciliation
+    """
+
+    def __init__(self):
+        self.added = 0
+        self.removed = 0
+        self.stripped = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def __str__(self) -> str:
+        return "{} roles added, {} roles removed, {} emojis cleared, {} operations skipped, {} failed".format(
+            self.added, self.removed, self.stripped, self.skipped, self.failed
+        )
 
 
 class ReactionsCog(commands.Cog, name='reactions'):
     def __init__(self, bot: commands.Bot):
-        self.message = None
-        self.banlist = []
+        """
+        Open events, by announce message ID
+        """
+        self.watched: typing.Dict[int, WatchedEvent] = {}
+
+        """
+        Open events, by guild ID then announce message ID
+        """
+        self.by_guild: typing.Dict[int, typing.Dict[int, WatchedEvent]] = {}
+
+        """
+        Registrations waiting for the end of the debounce delay, by (event ID, user ID)
+        """
+        self.toggles: typing.Dict[typing.Tuple[int, int], asyncio.TimerHandle] = {}
+
+        """
+        Stray reactions waiting for removal, by message ID then emoji
+        """
+        self.strays: typing.Dict[int, typing.Dict[str, discord.PartialEmoji]] = {}
+
+        """
+        Set when the checkpointed open events are restored
+        """
+        self.restored = asyncio.Event()
         self.bot = bot
+        if bot.is_ready():
+            bot.loop.create_task(self.on_ready())
+
+    def cog_unload(self):
+        handoff.export(self)
+
+    def export_state(self) -> dict:
+        """
+        State given to the next instance on a reload.
+        Pending registrations are cancelled here and armed again by the next instance.
+        :return:
+        """
+        for handle in self.toggles.values():
+            handle.cancel()
+        return {
+            'watched': self.watched,
+            'by_guild': self.by_guild,
+            'toggles': list(self.toggles.keys()),
+            'strays': self.strays,
+            'restored': self.restored.is_set(),
+        }
+
+    def import_state(self, state: dict) -> None:
+        """
+        Take over the state of a reloaded instance
+        :param state: Exported state
+        :return:
+        """
+        self.watched = state['watched']
+        self.by_guild = state['by_guild']
+        self.strays = state['strays']
+        for event_id, user_id in state['toggles']:
+            if event_id in self.watched:
+                self.debounce(self.watched[event_id], user_id)
+        if state['restored']:
+            self.restored.set()
+
+    def guild_events(self, guild_id: int, role_id: int = None) -> typing.List[WatchedEvent]:
+        """
+        Open events of a guild
+        :param guild_id: Guild ID
+        :param role_id: Only the events with this player role, all of them if None
+        :return:
+        """
+        return [
+            event for event in self.by_guild.get(guild_id, {}).values()
+            if role_id is None or event.player_role_id == role_id
+        ]
+
+    def ban_member(self, guild_id: int, user_id: int) -> None:
+        """
+        Add a user in the ban list of the guild open events
+        :param guild_id: Guild ID
+        :param user_id: User to ban
+        :return:
+        """
+        for event in self.guild_events(guild_id):
+            event.banned.add(user_id)
+            self.checkpoint(event, user_id, 'banned', True)
+
+    def is_participant(self, guild_id: int, user_id: int, role_id: int = None) -> bool:
+        """
+        Is a user registered in an open event of the guild
+        :param guild_id: Guild ID
+        :param user_id: User ID
+        :param role_id: Only the events with this player role, all of them if None
+        :return:
+        """
+        return any(event.is_participant(user_id) for event in self.guild_events(guild_id, role_id))
+
+    @staticmethod
+    def checkpoint(event: WatchedEvent, user_id: int, kind: str, present: bool) -> None:
+        """
+        Save a change of an open event in the store
+        :param event: The event
+        :param user_id: User ID
+        :param kind: 'reacted' or 'banned'
+        :param present: Add or remove the user
+        :return:
+        """
+        BotConfig.get_store().set_open_event_user(event.id, user_id, kind, present)
+
+    @staticmethod
+    def checkpoint_all(event: WatchedEvent) -> None:
+        """
+        Save the whole state of an open event in the store
+        :param event: The event
+        :return:
+        """
+        BotConfig.get_store().save_open_event(
+            event.guild_id, event.channel_id, event.id, event.reacted, event.banned
+        )
+
+    @commands.Cog.listener()
+    async def on_ready(self) -> None:
+        """
+        Restore the open events after a restart
+        :return:
+        """
+        if self.restored.is_set():
+            return
+        try:
+            await self.restore()
+        finally:
+            self.restored.set()
 
-    def ban_member(self, user_id: int) -> None:
+    async def restore(self) -> None:
         """
-        Add a user in event ban list
-        :param user_id:
+        Reload the checkpointed open events, then catch up with the reactions received while the bot was down.
+        Each open event costs one read of its ✅ users (one request by 100 users).
         :return:
         """
-        self.banlist.append(user_id)
+        store = BotConfig.get_store()
+        closed = []
+        tasks = []
+        for row, reacted, banned in store.open_events():
+            channel = self.bot.get_channel(row['channel_id'])  # type: discord.TextChannel
+            conf = BotConfig.from_guild_id(self.bot, row['guild_id'])
+            if channel is None or conf is None:
+                closed.append(row['message_id'])
+                continue
+            try:
+                message = await channel.fetch_message(row['message_id'])
+            except discord.NotFound:
+                closed.append(row['message_id'])
+                continue
+
+            event = WatchedEvent(message, conf.role_id)
+            event.reacted = reacted
+            event.banned = banned
+            self.register(event)
+            tasks.append(self.catch_up(event))
+
+        if closed:
+            store.delete_open_event(*closed)
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error("Catch up failed", exc_info=result)
+
+    async def catch_up(self, event: WatchedEvent) -> typing.Optional['ReconcileReport']:
+        """
+        Compare the announce reactions with the checkpoint.
+        The ✅ users are always read (one request by 100 users): the same count does not mean the same users
+        (a user left and another one joined while the bot was down). The roles are read and aligned only when
+        the users or the emojis differ from the checkpoint.
+        :param event: A restored event
+        :return: The reconciliation report, None if the checkpoint is up to date
+        """
+        check = discord.utils.get(event.message.reactions, emoji="✅")
+        strays = any(reaction.emoji != "✅" for reaction in event.message.reactions)
+        registered = None
+        if check is not None and check.me and not strays and check.count - 1 == len(event.reacted):
+            registered = {user.id async for user in check.users()}
+            registered.discard(self.bot.user.id)
+            if registered == event.reacted:
+                logger.info("Event restored: up to date", extra={'guild': event.guild_id, 'event': event.id})
+                return None
+
+        logger.info("Event restored: reconcile", extra={'guild': event.guild_id, 'event': event.id})
+        return await self.reconcile(event, registered)
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent) -> None:
@@ -24,24 +266,30 @@ class ReactionsCog(commands.Cog, name='reactions'):
         :param payload: The reaction raw payload
         :return:
         """
-        if self.message is None or payload.message_id != self.message.id or payload.guild_id is None or payload.user_id == self.bot.user.id:
+        event = self.watched.get(payload.message_id)
+        if event is None or payload.guild_id is None or payload.user_id == self.bot.user.id:
             return
 
         if payload.emoji.name != "✅":
-            print("Not THE emoji")
-            channel = self.bot.get_channel(payload.channel_id)  # type: discord.TextChannel
-            if channel.guild is not None:
-                message = await channel.fetch_message(payload.message_id)
-                await message.remove_reaction(payload.emoji, payload.member)
-                return
+            logger.debug("Stray reaction %s", payload.emoji, extra={
+                'guild': payload.guild_id, 'event': event.id, 'user': payload.user_id, 'sample': True
+            })
+            self.remove_stray(payload.guild_id, payload.channel_id, payload.message_id, payload.emoji)
+            return
 
-        if payload.member.id in self.banlist:
+        event.reacted.add(payload.user_id)
+        self.checkpoint(event, payload.user_id, 'reacted', True)
+        conf = BotConfig.from_guild_id(self.bot, payload.guild_id)
+        if conf is not None:
+            conf.members.add(payload.member)
+        if payload.user_id in event.banned:
             await payload.member.send("Désolé, mais vous ne pouvez plus participez à cet événemet.")
             return
 
-        print("All is OK")
-        conf = BotConfig.from_guild_id(self.bot, payload.guild_id)
-        await payload.member.add_roles(conf.player_role)
+        logger.debug("Registration", extra={
+            'guild': payload.guild_id, 'event': event.id, 'user': payload.user_id, 'sample': True
+        })
+        self.debounce(event, payload.user_id)
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent) -> None:
@@ -50,46 +298,209 @@ class ReactionsCog(commands.Cog, name='reactions'):
         :param payload: The raw Payload
         :return:
         """
-        if self.message is None or payload.message_id != self.message.id or payload.guild_id is None:
+        event = self.watched.get(payload.message_id)
+        if event is None or payload.guild_id is None:
             return
 
         if payload.emoji.name != "✅":
-            print("Not THE emoji WHAT ?!")
+            logger.debug("Stray reaction removed %s", payload.emoji, extra={
+                'guild': payload.guild_id, 'event': event.id, 'user': payload.user_id, 'sample': True
+            })
             return
 
-        print("All is OK")
-        conf = BotConfig.from_guild_id(self.bot, payload.guild_id)
-        member = conf.guild.get_member(payload.user_id)
-        await member.remove_roles(conf.player_role)
+        logger.debug("Unregistration", extra={
+            'guild': payload.guild_id, 'event': event.id, 'user': payload.user_id, 'sample': True
+        })
+        event.reacted.discard(payload.user_id)
+        self.checkpoint(event, payload.user_id, 'reacted', False)
+        self.debounce(event, payload.user_id)
+
+    def debounce(self, event: WatchedEvent, user_id: int) -> None:
+        """
+        Apply the registration of a user after a quiet period.
+        Each new reaction of the user on the event restarts the delay, only the final state is applied.
+        :param event: The event
+        :param user_id: User ID
+        :return:
+        """
+        key = (event.id, user_id)
+        if key in self.toggles:
+            self.toggles[key].cancel()
+        self.toggles[key] = self.bot.loop.call_later(
+            BotConfig.reaction_debounce,
+            lambda: asyncio.ensure_future(self.apply_registration(key, event.guild_id, user_id))
+        )
 
-    async def set_message(self, message: typing.Optional[discord.Message]) -> None:
+    async def apply_registration(self, key: typing.Tuple[int, int], guild_id: int, user_id: int) -> None:
+        """
+        Give or remove the player role of the event, from the registrations in the open events of the guild
+        :param key: Debounce key (event ID, user ID)
+        :param guild_id: Guild ID
+        :param user_id: User ID
+        :return:
         """
-        Set the message to monitor
+        self.toggles.pop(key, None)
+        conf = BotConfig.from_guild_id(self.bot, guild_id)
+        if conf is None:
+            return
+        event = self.watched.get(key[0])
+        role = discord.Object(id=event.player_role_id if event is not None else conf.role_id)
+        try:
+            if self.is_participant(guild_id, user_id, role.id):
+                await conf.roles.add(user_id, role)
+            else:
+                await conf.roles.remove(user_id, role)
+        except discord.HTTPException as error:
+            logger.warning("Registration failed: %s", error, extra={'guild': guild_id, 'user': user_id})
+
+    def remove_stray(self, guild_id: int, channel_id: int, message_id: int, emoji: discord.PartialEmoji) -> None:
+        """
+        Queue the removal of a reaction other than ✅.
+        Strays of a message are grouped for a short time, then each emoji is cleared with one request,
+        whatever the number of users who used it.
+        :param guild_id: Guild ID
+        :param channel_id: Channel ID
+        :param message_id: Message ID
+        :param emoji: The reaction emoji
+        :return:
+        """
+        metrics.STRAY_REACTIONS.inc(str(guild_id))
+        if message_id not in self.strays:
+            self.strays[message_id] = {}
+            self.bot.loop.call_later(
+                BotConfig.stray_reaction_window,
+                lambda: asyncio.ensure_future(self.flush_strays(channel_id, message_id))
+            )
+        self.strays[message_id][str(emoji)] = emoji
+
+    async def flush_strays(self, channel_id: int, message_id: int) -> None:
+        """
+        Remove the stray reactions of a message, without fetching it
+        :param channel_id: Channel ID
+        :param message_id: Message ID
+        :return:
+        """
+        emojis = self.strays.pop(message_id, {})
+        channel = self.bot.get_channel(channel_id)  # type: discord.TextChannel
+        if channel is None:
+            return
+
+        message = channel.get_partial_message(message_id)
+        for emoji in emojis.values():
+            metrics.STRAY_CLEARS.inc(str(channel.guild.id))
+            try:
+                await message.clear_reaction(emoji)
+            except discord.NotFound:
+                return
+            except discord.HTTPException as error:
+                logger.warning("Stray reaction %s not cleared: %s", emoji, error, extra={
+                    'guild': channel.guild.id, 'event': message_id
+                })
+
+    async def watch(self, message: discord.Message) -> 'ReconcileReport':
+        """
+        Open an event: monitor registrations on its announce
         :param message: Discord message
+        :return: Report of the initial reconciliation
+        """
+        conf = BotConfig.from_guild_id(self.bot, message.guild.id)
+        event = WatchedEvent(message, conf.role_id)
+        self.register(event)
+        return await self.reconcile(event)
+
+    def register(self, event: WatchedEvent) -> None:
+        """
+        Add an event in the open events
+        :param event: The event
         :return:
         """
-        self.message = message
-        self.banlist.clear()
+        self.watched[event.id] = event
+        self.by_guild.setdefault(event.guild_id, {})[event.id] = event
 
+    async def reconcile(self, event: WatchedEvent,
+                        registered: typing.Optional[typing.Set[int]] = None) -> 'ReconcileReport':
+        """
+        Align the player role and the announce reactions with the registrations.
+        Only the differences are sent: roles to add, roles to remove and stray emojis to clear.
+        :param event: An open event
+        :param registered: Users with a ✅ reaction when they were just read, None to read them
+        :return: The report
+        """
+        conf = BotConfig.from_guild_id(self.bot, event.guild_id)
+        report = ReconcileReport()
         tasks = []
-        players = []
-
-        if self.message is not None:
-            conf = BotConfig.from_guild_id(self.bot, message.guild.id)
-            tasks.append(message.add_reaction("✅"))
+        fetch = registered is None
+        registered = set() if fetch else set(registered)
+        has_check = False
 
-            for reaction in self.message.reactions:
-                if reaction.emoji == "✅":
+        for reaction in event.message.reactions:
+            if reaction.emoji == "✅":
+                has_check = reaction.me
+                if fetch:
                     async for user in reaction.users():
-                        if user.id != self.bot.user.id:
-                            tasks.append(user.add_roles(conf.player_role))
-                            players.append(user.id)
-                else:
-                    async for user in reaction.users():
-                        tasks.append(self.message.remove_reaction(reaction.emoji, user))
+                        registered.add(user.id)
+            else:
+                report.stripped += 1
+                tasks.append(event.message.clear_reaction(reaction.emoji))
+
+        if not has_check:
+            tasks.append(event.message.add_reaction("✅"))
+
+        registered.discard(self.bot.user.id)
+        event.reacted = registered
+        self.checkpoint_all(event)
+
+        report.skipped = 1 if has_check else 0
+        wanted = set().union(*[
+            guild_event.participants for guild_event in self.guild_events(event.guild_id, event.player_role_id)
+        ])
+        role = conf.guild.get_role(event.player_role_id)
+        if role is None:
+            logger.warning("Player role %d not found, roles not reconciled", event.player_role_id, extra={
+                'guild': event.guild_id, 'event': event.id
+            })
+        else:
+            current = {member.id for member in await conf.members.role_members(role)}
 
-            for player in conf.player_role.members:
-                if player.id not in players:
-                    tasks.append(player.remove_roles(conf.player_role))
+            for user_id in wanted - current:
+                tasks.append(conf.roles.add(user_id, role))
+            for user_id in current - wanted:
+                tasks.append(conf.roles.remove(user_id, role))
 
-        await asyncio.gather(*tasks)
+            report.added = len(wanted - current)
+            report.removed = len(current - wanted)
+            report.skipped += len(wanted & current)
+
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                report.failed += 1
+                logger.warning("Reconcile operation failed: %s", result, extra={
+                    'guild': event.guild_id, 'event': event.id
+                })
+        logger.info("Event reconciled: %s", report, extra={'guild': event.guild_id, 'event': event.id})
+        return report
+
+    def unwatch(self, message_id: int) -> typing.Optional[WatchedEvent]:
+        """
+        Stop monitoring an event
+        :param message_id: Announce message ID
+        :return: The event, None if it was not open
+        """
+        event = self.watched.pop(message_id, None)
+        if event is not None:
+            self.by_guild[event.guild_id].pop(message_id)
+            BotConfig.get_store().delete_open_event(message_id)
+        return event
+
+    def unwatch_guild(self, guild_id: int) -> typing.List[WatchedEvent]:
+        """
+        Stop monitoring all events of a guild
+        :param guild_id: Guild ID
+        :return: The closed events
+        """
+        events = list(self.by_guild.pop(guild_id, {}).values())
+        for event in events:
+            del self.watched[event.id]
+        if events:
+            BotConfig.get_store().delete_open_event(*[event.id for event in events])
+        return events
@@ -2,25 +2,38 @@ from .PlannerManager import EventManagementCog
 from .ReactionsManager import ReactionsCog
 from .GameMastering import GameMasterCog
 from .BotAdministration import BotManagementCog
+from . import handoff
 from discord.ext.commands import Bot
+import logging
+import time
 
 __requires__ = ['EventBot']
 VERSION = "1.0.0"
 
 def setup(bot: Bot):
     """
-    Insert cog in bot
+    Insert cog in bot.
+    On a reload, the new cogs take over the state exported by the old ones (open events, scheduler
+    deadlines, pending registrations), so nothing is fetched again from Discord.
     :param bot:
     :return:
     """
-    bot.add_cog(EventManagementCog(bot))
-    bot.add_cog(BotManagementCog(bot))
-    bot.add_cog(ReactionsCog(bot))
-    bot.add_cog(GameMasterCog(bot))
+    start = time.perf_counter()
+    states = handoff.take(bot)
+    for cog in (EventManagementCog(bot), BotManagementCog(bot), ReactionsCog(bot), GameMasterCog(bot)):
+        if cog.qualified_name in states:
+            cog.import_state(states[cog.qualified_name])
+        bot.add_cog(cog)
+
+    if states:
+        logging.getLogger(__name__).info("State restored in %.1f ms", (time.perf_counter() - start) * 1000)
 
 
 def teardown(bot: Bot):
-    bot.remove_cog(EventManagementCog.__name__)
-    bot.remove_cog(BotManagementCog.__name__)
-    bot.remove_cog(ReactionsCog.__name__)
-    bot.remove_cog(GameMasterCog.__name__)
\ No newline at end of file
+    """
+    Remove cogs from bot. Stateful cogs export their state when they are unloaded.
+    :param bot:
+    :return:
+    """
+    for cog in (EventManagementCog, BotManagementCog, ReactionsCog, GameMasterCog):
+        bot.remove_cog(cog.__cog_name__)
\ No newline at end of file
@@ -0,0 +1,39 @@
+from discord.ext import commands
+import typing
+
+"""
+Bot attribute keeping the state of the cogs between the teardown and the setup of a reload
+"""
+HANDOFF_ATTRIBUTE = 'event_manager_handoff'
+
+
+def states(bot: commands.Bot) -> typing.Dict[str, dict]:
+    """
+    States exported by the unloaded cogs, by cog name.
+    They are stored on the bot, which survives the reload of the extension modules.
+    :param bot: Bot agent
+    :return:
+    """
+    if not hasattr(bot, HANDOFF_ATTRIBUTE):
+        setattr(bot, HANDOFF_ATTRIBUTE, {})
+    return getattr(bot, HANDOFF_ATTRIBUTE)
+
+
+def export(cog: commands.Cog) -> None:
+    """
+    Save the state of an unloaded cog for the next instance
+    :param cog: A cog with an export_state method
+    :return:
+    """
+    states(cog.bot)[cog.qualified_name] = cog.export_state()
+
+
+def take(bot: commands.Bot) -> typing.Dict[str, dict]:
+    """
+    Get and forget the exported states
+    :param bot: Bot agent
+    :return:
+    """
+    result = dict(states(bot))
+    states(bot).clear()
+    return result
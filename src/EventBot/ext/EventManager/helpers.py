@@ -1,11 +1,13 @@
-import datetime
-
 from EventBot.config import BotConfig
 from EventBot.objects import EventMessage
+from EventBot.purge import purge
 import asyncio
+import logging
 import typing
 from discord.ext import commands
 
+logger = logging.getLogger(__name__)
+
 
 async def reset_game(config: BotConfig) -> None:
     """
@@ -13,32 +15,36 @@ async def reset_game(config: BotConfig) -> None:
     :param config: a Bot Configuration
     :return:
     """
-    print("Reset channel {}".format(config.temp_channel.name))
-
-    after = datetime.datetime.now()
-    after -= datetime.timedelta(days=13)
-
-    await config.temp_channel.delete_messages(await config.temp_channel.history(after=after).flatten())
-
-    async for message in config.temp_channel.history():
-        await message.delete()
-    await config.temp_channel.send("Ce salon est automatiquement effacé à la fin de la journée. Il sert à partager les liens des tables.\nBon jeu !")
+    logger.info("Reset channel %s", config.temp_channel.name, extra={'guild': config.guild_id})
+
+    channel, report = await purge(
+        config.temp_channel, config.purge_strategy, config.purge_clone_threshold,
+        config.store.last_purge(config.guild_id, config.temp_channel_id)
+    )
+    config.store.mark_purged(config.guild_id, channel.id)
+    if channel.id != config.temp_channel_id:
+        config.temp_channel_id = channel.id
+        config.channels_changed()
+        if config.config_file is not None:
+            config.save_file(config.config_file)
+    logger.info("Reset channel %s: %s", channel.name, report, extra={'guild': config.guild_id})
+    await channel.send("Ce salon est automatiquement effacé à la fin de la journée. Il sert à partager les liens des tables.\nBon jeu !")
 
     tasks = []
 
     for vocal in config.voices_channels:
         for member in vocal.members:
-            print("Disconnect {}".format(member))
+            logger.debug("Disconnect %s", member, extra={'guild': config.guild_id, 'user': member.id})
             tasks.append(member.move_to(None))
 
     for role in [config.player_role, config.gm_role]:
-        for member in role.members:
-            print("Remove {} from {}".format(role, member))
-            tasks.append(member.remove_roles(role))
+        for member in await config.members.role_members(role):
+            logger.debug("Remove %s from %s", role, member, extra={'guild': config.guild_id, 'user': member.id})
+            tasks.append(config.roles.remove(member.id, role))
 
-    if config.reactions_cog is not None and config.reactions_cog.message is not None:
-        tasks.append(config.reactions_cog.message.delete())
-        tasks.append(config.reactions_cog.set_message(None))
+    if config.reactions_cog is not None:
+        for event in config.reactions_cog.unwatch_guild(config.guild_id):
+            tasks.append(event.message.delete())
 
     await asyncio.gather(*tasks)
 
@@ -50,10 +56,4 @@ async def get_announces(ctx: commands.Context) -> typing.Sequence[EventMessage]:
     :return: List of Event Message
     """
     conf = BotConfig.from_context(ctx)
-    events = []
-
-    async for message in conf.announce.history():
-        event = EventMessage(conf, message)
-        if event.date is not None:
-            events.append(event)
-    return events
+    return [event for event in await conf.get_events() if event.date is not None]
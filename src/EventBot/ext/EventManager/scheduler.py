@@ -0,0 +1,144 @@
+from EventBot.objects import EventMessage
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+import typing
+
+"""
+Delay after a deadline before running the update, so the date comparisons are already true
+"""
+DEADLINE_MARGIN = timedelta(seconds=1)
+
+
+def heading_name(event: typing.Optional[EventMessage], now: datetime) -> str:
+    """
+    Name of the heading channel for the next event
+    :param event: The next event
+    :param now: Current date
+    :return:
+    """
+    if event is None:
+        return "📅Pas de soirée à venir"
+    if event.date <= now:
+        return "📅Événement en cours"
+    days = (event.date.date() - now.date()).days
+    if days == 0:
+        return event.date.strftime("📅Aujourd'hui à %H:%M")
+    if days == 1:
+        return event.date.strftime("📅Demain à %H:%M")
+    return event.date.strftime("📅Soirée %d/%m à %H:%M")
+
+
+def transitions(event: EventMessage) -> typing.List[datetime]:
+    """
+    Dates when the state of an event changes: opening, closing and heading changes
+    :param event: The event
+    :return:
+    """
+    midnight = datetime.combine(event.date.date(), datetime.min.time())
+    return [
+        midnight - timedelta(days=1),
+        midnight,
+        event.open_date,
+        event.date,
+        event.close_date,
+    ]
+
+
+class EventScheduler:
+    """
+    Heap of the next event transitions of each guild.
+    The scheduler sleeps until the next deadline, then calls the callback for the guild. Arming a guild
+    replaces its deadlines (older entries of the heap are ignored).
+    """
+
+    def __init__(self, callback: typing.Callable[[int], typing.Awaitable[None]]):
+        """
+        :param callback: Coroutine called with the guild ID when a deadline is reached
+        """
+        self.callback = callback
+        self._heap: typing.List[typing.Tuple[datetime, int, int]] = []
+        self._generations: typing.Dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+
+    def arm(self, guild_id: int, event: typing.Optional[EventMessage]) -> None:
+        """
+        Replace the deadlines of a guild with the transitions of its next event
+        :param guild_id: Guild ID
+        :param event: Next event of the guild
+        :return:
+        """
+        generation = self._generations.get(guild_id, 0) + 1
+        self._generations[guild_id] = generation
+
+        if event is not None and event.date is not None:
+            now = datetime.now()
+            for deadline in transitions(event):
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline + DEADLINE_MARGIN, guild_id, generation))
+        self._wakeup.set()
+
+    def export_state(self) -> typing.Tuple[list, dict]:
+        """
+        Deadlines, for another scheduler
+        :return:
+        """
+        return self._heap, self._generations
+
+    def import_state(self, state: typing.Tuple[list, dict]) -> None:
+        """
+        Take the deadlines of another scheduler
+        :param state: Exported deadlines
+        :return:
+        """
+        self._heap, self._generations = state
+        self._wakeup.set()
+
+    def disarm(self, guild_id: int) -> None:
+        """
+        Remove the deadlines of a guild
+        :param guild_id: Guild ID
+        :return:
+        """
+        self.arm(guild_id, None)
+
+    @property
+    def next_deadline(self) -> typing.Optional[datetime]:
+        """
+        Date of the next valid deadline
+        :return:
+        """
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self) -> None:
+        """
+        Remove replaced deadlines from the top of the heap
+        :return:
+        """
+        while self._heap and self._heap[0][2] != self._generations.get(self._heap[0][1]):
+            heapq.heappop(self._heap)
+
+    async def run(self) -> None:
+        """
+        Scheduler loop
+        :return:
+        """
+        while True:
+            self._wakeup.clear()
+            deadline = self.next_deadline
+            timeout = None if deadline is None else max((deadline - datetime.now()).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+                continue
+            except asyncio.TimeoutError:
+                pass
+
+            due = set()
+            now = datetime.now()
+            while self._heap and self._heap[0][0] <= now:
+                _, guild_id, generation = heapq.heappop(self._heap)
+                if generation == self._generations.get(guild_id):
+                    due.add(guild_id)
+
+            await asyncio.gather(*[self.callback(guild_id) for guild_id in due], return_exceptions=True)
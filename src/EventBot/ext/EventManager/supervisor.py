@@ -0,0 +1,101 @@
+from EventBot import metrics
+import asyncio
+import logging
+import random
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+
+class GuildUpdateState:
+    """
+    Update state of a guild
+    """
+
+    def __init__(self):
+        """
+        Consecutive failures
+        """
+        self.failures: int = 0
+
+        """
+        No update before this date (time.monotonic), after failures
+        """
+        self.retry_at: typing.Optional[float] = None
+
+        """
+        Error of the last failed update
+        """
+        self.last_error: typing.Optional[BaseException] = None
+
+        """
+        Only one update at a time for a guild
+        """
+        self.lock = asyncio.Lock()
+
+
+class UpdateSupervisor:
+    """
+    Run guild updates concurrently, with a concurrency limit.
+    Each guild is isolated: a failure only delays the next updates of this guild (exponential backoff).
+    """
+
+    def __init__(self, concurrency: int = 4, jitter: float = 5.0, backoff: float = 30.0, max_backoff: float = 3600.0):
+        """
+        :param concurrency: Max number of guilds updated at the same time
+        :param jitter: Max random delay before a periodic update, in seconds
+        :param backoff: Delay after a first failure, in seconds
+        :param max_backoff: Max delay after failures, in seconds
+        """
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.jitter = jitter
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.states: typing.Dict[int, GuildUpdateState] = {}
+
+    def state(self, guild_id: int) -> GuildUpdateState:
+        """
+        Get the update state of a guild
+        :param guild_id: Guild ID
+        :return:
+        """
+        if guild_id not in self.states:
+            self.states[guild_id] = GuildUpdateState()
+        return self.states[guild_id]
+
+    async def run(self, guild_id: int, update: typing.Callable[[], typing.Awaitable[None]],
+                  periodic: bool = True) -> bool:
+        """
+        Run an update for a guild
+        :param guild_id: Guild ID
+        :param update: Coroutine function doing the update
+        :param periodic: Periodic update: skipped while the guild is in backoff, and delayed by a random jitter
+        :return: True if the update succeeded, False if it failed or was skipped
+        """
+        state = self.state(guild_id)
+        if periodic:
+            if state.retry_at is not None and time.monotonic() < state.retry_at:
+                return False
+            if self.jitter > 0:
+                await asyncio.sleep(random.uniform(0, self.jitter))
+
+        async with state.lock, self.semaphore:
+            start = time.perf_counter()
+            status = 'error'
+            try:
+                await update()
+            except Exception as error:
+                state.failures += 1
+                state.last_error = error
+                delay = min(self.backoff * 2 ** (state.failures - 1), self.max_backoff)
+                state.retry_at = time.monotonic() + delay * random.uniform(0.5, 1.0)
+                logger.error("Update failed (%d times)", state.failures, exc_info=error, extra={'guild': guild_id})
+                return False
+            else:
+                status = 'ok'
+                state.failures = 0
+                state.retry_at = None
+                return True
+            finally:
+                metrics.GUILD_UPDATES.observe(time.perf_counter() - start, str(guild_id), status)
@@ -0,0 +1,87 @@
+import bisect
+import typing
+from datetime import datetime
+from .objects import EventMessage
+
+
+class EventIndex:
+    """
+    In-memory events of a guild announce channel.
+    Events are parsed once, then kept up to date from the gateway events. The event store keeps a copy
+    on disk for the next start.
+    """
+
+    def __init__(self):
+        self.events: typing.Dict[int, EventMessage] = {}
+        self.by_date: typing.List[typing.Tuple[datetime, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self.events
+
+    def get(self, message_id: int) -> typing.Optional[EventMessage]:
+        """
+        Get an event by message ID
+        :param message_id: Announce message ID
+        :return:
+        """
+        return self.events.get(message_id)
+
+    def clear(self) -> None:
+        """
+        Remove all events
+        :return:
+        """
+        self.events.clear()
+        self.by_date.clear()
+
+    def put(self, event: EventMessage) -> None:
+        """
+        Add or replace an event
+        :param event: The parsed announce
+        :return:
+        """
+        self.remove(event.id)
+        self.events[event.id] = event
+        if event.date is not None:
+            bisect.insort(self.by_date, (event.date, event.id))
+
+    def remove(self, *message_ids: int) -> None:
+        """
+        Remove events
+        :param message_ids: Announces messages IDs
+        :return:
+        """
+        for message_id in message_ids:
+            event = self.events.pop(message_id, None)
+            if event is not None and event.date is not None:
+                position = bisect.bisect_left(self.by_date, (event.date, event.id))
+                del self.by_date[position]
+
+    def next_event(self) -> typing.Optional[EventMessage]:
+        """
+        The event with the lowest date
+        :return:
+        """
+        return self.events[self.by_date[0][1]] if self.by_date else None
+
+    def latest(self, limit: int = None) -> typing.List[EventMessage]:
+        """
+        Announces, newest message first (like the channel history)
+        :param limit: Max number of announces
+        :return:
+        """
+        return [self.events[message_id] for message_id in sorted(self.events, reverse=True)[:limit]]
+
+    def between(self, begin: datetime, end: datetime) -> typing.List[EventMessage]:
+        """
+        Events strictly between two dates
+        :param begin: Lower date
+        :param end: Upper date
+        :return:
+        """
+        first = bisect.bisect_right(self.by_date, (begin, float('inf')))
+        last = bisect.bisect_left(self.by_date, (end, 0))
+        return [self.events[message_id] for _, message_id in self.by_date[first:last]]
@@ -0,0 +1,85 @@
+"""
+Logging of the bot.
+Records are put in a queue by the event loop and written by a listener thread, so a slow terminal or pipe
+never blocks the loop. Structured fields are given with extra: guild, event and user IDs.
+"""
+from logging.handlers import QueueHandler, QueueListener
+import logging
+import queue
+import sys
+import typing
+
+"""
+Structured fields shown after the message, in this order
+"""
+FIELDS = ('guild', 'event', 'user')
+
+"""
+Default format of the log lines
+"""
+FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+"""
+Keep one record of this number for high-frequency records (logged with extra={'sample': True})
+"""
+SAMPLE_RATE = 100
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formatter adding the structured fields (key=value) to the message
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = ["{}={}".format(field, getattr(record, field)) for field in FIELDS if hasattr(record, field)]
+        if getattr(record, 'sampled', 0) > 1:
+            fields.append("sampled=1/{}".format(record.sampled))
+        return line if not fields else "{} [{}]".format(line, " ".join(fields))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one of every `rate` records marked with sample=True, for each logger and message template
+    """
+
+    def __init__(self, rate: int = SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+        self.counters: typing.Dict[typing.Tuple[str, str], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sample', False) or self.rate <= 1:
+            return True
+        key = (record.name, str(record.msg))
+        count = self.counters.get(key, 0)
+        self.counters[key] = (count + 1) % self.rate
+        record.sampled = self.rate
+        return count == 0
+
+
+def setup_logging(level: int = logging.INFO, stream: typing.TextIO = None,
+                  sample_rate: int = SAMPLE_RATE) -> QueueListener:
+    """
+    Send the records of all loggers to a queue, written to the stream by a background thread
+    :param level: Min level of the root logger
+    :param stream: Output, stderr by default
+    :param sample_rate: Keep one of this number of high-frequency records
+    :return: The started listener (stop it to flush the queue)
+    """
+    records = queue.Queue(-1)
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(StructuredFormatter(FORMAT))
+
+    handler = QueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for previous in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+        root.removeHandler(previous)
+    root.addHandler(handler)
+
+    listener = QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,186 @@
+from collections import OrderedDict
+from discord.ext import commands
+import discord
+import logging
+import typing
+
+logger = logging.getLogger(__name__)
+
+"""
+Max number of members requested by ID in one gateway query
+"""
+QUERY_SIZE = 100
+
+
+class MemberCache:
+    """
+    Members of a guild in the low memory mode. The members are not requested at startup, so the bot cache only
+    keeps the members in voice channels. The recently seen members are kept in a bounded LRU and the other ones
+    are fetched when needed. The members of a role are fetched once, then kept up to date from the gateway member
+    updates and the role changes of the bot.
+    Without a size, every member is in the bot cache and this is only a view of it.
+    """
+
+    def __init__(self, bot: commands.Bot, guild_id: int, size: typing.Optional[int] = None):
+        """
+        :param bot: Bot agent
+        :param guild_id: Guild ID
+        :param size: Max number of members kept, None when the bot cache keeps all members
+        """
+        self.bot = bot
+        self.guild_id = guild_id
+        self.size = size
+        self.members: 'OrderedDict[int, discord.Member]' = OrderedDict()
+        self.fetched = 0
+
+        """
+        Members IDs of the roles already fetched, by role ID
+        """
+        self.role_holders: typing.Dict[int, typing.Set[int]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Is the low memory mode on
+        :return:
+        """
+        return self.size is not None
+
+    @property
+    def guild(self) -> typing.Optional[discord.Guild]:
+        return self.bot.get_guild(self.guild_id)
+
+    def get(self, user_id: int) -> typing.Optional[discord.Member]:
+        """
+        A member from the bot cache or from the LRU
+        :param user_id: User ID
+        :return: None if not cached
+        """
+        guild = self.guild
+        member = guild.get_member(user_id) if guild is not None else None
+        if member is None and user_id in self.members:
+            member = self.members[user_id]
+            self.members.move_to_end(user_id)
+        return member
+
+    def add(self, member: discord.Member) -> None:
+        """
+        Keep a member seen in a gateway event or fetched, the least recently seen member is dropped when full
+        :param member: The member
+        :return:
+        """
+        if not self.enabled or member is None:
+            return
+        self.members[member.id] = member
+        self.members.move_to_end(member.id)
+        while len(self.members) > self.size:
+            self.members.popitem(last=False)
+
+    def discard(self, user_id: int) -> None:
+        """
+        Forget a member (left the guild)
+        :param user_id: User ID
+        :return:
+        """
+        self.members.pop(user_id, None)
+        for holders in self.role_holders.values():
+            holders.discard(user_id)
+
+    def update(self, data: dict) -> None:
+        """
+        Apply a gateway member update to a member of the LRU (discord.py drops the updates of uncached members)
+        and to the members of the fetched roles
+        :param data: GUILD_MEMBER_UPDATE payload
+        :return:
+        """
+        user_id = int(data['user']['id'])
+        member = self.members.get(user_id)
+        if member is not None:
+            member._update(data)
+
+        roles = {int(role_id) for role_id in data.get('roles', ())}
+        for role_id, holders in self.role_holders.items():
+            if role_id in roles:
+                holders.add(user_id)
+            else:
+                holders.discard(user_id)
+
+    def role_changed(self, user_id: int, role_id: int, present: bool) -> None:
+        """
+        Record a role change applied by the bot (before its gateway member update)
+        :param user_id: User ID
+        :param role_id: Role ID
+        :param present: Role added or removed
+        :return:
+        """
+        holders = self.role_holders.get(role_id)
+        if holders is None:
+            return
+        if present:
+            holders.add(user_id)
+        else:
+            holders.discard(user_id)
+
+    def forget_roles(self) -> None:
+        """
+        Drop the members of the fetched roles: member updates may have been missed (new gateway session)
+        :return:
+        """
+        self.role_holders.clear()
+
+    async def role_members(self, role: discord.Role) -> typing.List[discord.Member]:
+        """
+        Members of a role. In the low memory mode the member list is fetched the first time (one request by
+        1000 members) and the members of the role are kept. The next times, only the members missing in the LRU
+        are requested, by ID.
+        :param role: The role
+        :return:
+        """
+        guild = self.guild
+        if not self.enabled or guild is None or guild.chunked:
+            return role.members
+
+        holders = self.role_holders.get(role.id)
+        if holders is not None:
+            return await self._holders(guild, role, holders)
+
+        members = []
+        count = 0
+        async for member in guild.fetch_members(limit=None):
+            count += 1
+            if role in member.roles:
+                self.add(member)
+                members.append(member)
+        self.fetched += count
+        self.role_holders[role.id] = {member.id for member in members}
+        logger.debug("Members of %s fetched: %d/%d", role, len(members), count, extra={'guild': self.guild_id})
+        return members
+
+    async def _holders(self, guild: discord.Guild, role: discord.Role,
+                       holders: typing.Set[int]) -> typing.List[discord.Member]:
+        """
+        Members of a fetched role, the members missing in the LRU are requested on the gateway by ID
+        :param guild: The guild
+        :param role: The role
+        :param holders: Members IDs of the role
+        :return:
+        """
+        members = []
+        missing = []
+        for user_id in holders:
+            member = self.get(user_id)
+            if member is not None:
+                members.append(member)
+            else:
+                missing.append(user_id)
+
+        for start in range(0, len(missing), QUERY_SIZE):
+            batch = missing[start:start + QUERY_SIZE]
+            found = await guild.query_members(user_ids=batch, limit=len(batch), cache=False)
+            for member in found:
+                self.add(member)
+                members.append(member)
+            self.fetched += len(found)
+            holders.difference_update(set(batch) - {member.id for member in found})
+        logger.debug("Members of %s: %d, %d requested", role, len(members), len(missing), extra={'guild': self.guild_id})
+        return members
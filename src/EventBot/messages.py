@@ -0,0 +1,115 @@
+"""
+Message cache limited to the channels used by the cogs (announce and temp channels).
+discord.py keeps the last messages of every channel the bot can see, they are dropped here at ingest.
+"""
+from collections import deque
+from discord.state import ConnectionState
+import discord
+import typing
+
+
+class MessageCache:
+    """
+    Last messages of the watched channels, with a size cap by channel.
+    It replaces the deque of the discord.py connection state, so it has the same interface.
+    """
+
+    def __init__(self, channels: typing.Callable[[], typing.Container[int]], size: int):
+        """
+        :param channels: IDs of the watched channels (read at each message)
+        :param size: Max number of messages by channel
+        """
+        self.channels = channels
+        self.size = size
+        self.by_channel: typing.Dict[int, typing.Deque[discord.Message]] = {}
+        self.by_id: typing.Dict[int, discord.Message] = {}
+        self.dropped = 0
+
+    def append(self, message: discord.Message) -> None:
+        """
+        Keep a message of a watched channel, the oldest message of the channel is dropped when full
+        :param message: The message
+        :return:
+        """
+        channel_id = message.channel.id
+        if channel_id not in self.channels():
+            self.dropped += 1
+            return
+        messages = self.by_channel.get(channel_id)
+        if messages is None:
+            messages = self.by_channel[channel_id] = deque()
+        messages.append(message)
+        self.by_id[message.id] = message
+        while len(messages) > self.size:
+            del self.by_id[messages.popleft().id]
+
+    def remove(self, message: discord.Message) -> None:
+        """
+        Forget a deleted message
+        :param message: The message
+        :return:
+        """
+        messages = self.by_channel.get(message.channel.id)
+        if messages is not None and self.by_id.pop(message.id, None) is not None:
+            messages.remove(message)
+            if not messages:
+                del self.by_channel[message.channel.id]
+
+    def get(self, message_id: int) -> typing.Optional[discord.Message]:
+        """
+        A cached message
+        :param message_id: Message ID
+        :return: None if not cached
+        """
+        return self.by_id.get(message_id)
+
+    def reset(self, messages: typing.Iterable[discord.Message] = ()) -> None:
+        """
+        Replace the cached messages
+        :param messages: Messages to keep (still filtered by channel)
+        :return:
+        """
+        messages = list(messages)
+        self.by_channel.clear()
+        self.by_id.clear()
+        for message in messages:
+            self.append(message)
+
+    def __iter__(self) -> typing.Iterator[discord.Message]:
+        for messages in list(self.by_channel.values()):
+            yield from list(messages)
+
+    def __reversed__(self) -> typing.Iterator[discord.Message]:
+        return reversed(list(self))
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+
+class TargetedConnectionState(ConnectionState):
+    """
+    Connection state whose message cache only keeps the messages of the watched channels
+    """
+
+    def __init__(self, *args, channels: typing.Callable[[], typing.Container[int]], size: int, **kwargs):
+        """
+        :param channels: IDs of the watched channels
+        :param size: Max number of messages by channel
+        """
+        self.message_cache = MessageCache(channels, size)
+        super().__init__(*args, **kwargs)
+
+    @property
+    def _messages(self) -> MessageCache:
+        return self.message_cache
+
+    @_messages.setter
+    def _messages(self, messages: typing.Optional[typing.Iterable[discord.Message]]) -> None:
+        # discord.py replaces its deque on clear and when a guild is removed
+        self.message_cache.reset(messages or ())
+
+    def _get_message(self, msg_id: int) -> typing.Optional[discord.Message]:
+        return self.message_cache.get(msg_id)
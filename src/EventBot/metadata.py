@@ -0,0 +1,55 @@
+"""
+Metadata read without importing discord.py or the extensions, for the command line
+"""
+from configparser import ConfigParser
+import ast
+import importlib.util
+import typing
+
+
+def read_config(file: str) -> ConfigParser:
+    """
+    Read the configuration file
+    :param file: filename to load
+    :return:
+    """
+    config = ConfigParser()
+    config.read(file, encoding='utf-8-sig')
+    return config
+
+
+def module_version(name: str) -> typing.Optional[str]:
+    """
+    Read the VERSION constant of a module from its source, without executing it
+    :param name: Module name
+    :return: None if the module or the constant is missing
+    """
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.origin is None or not spec.origin.endswith('.py'):
+        return None
+
+    with open(spec.origin, encoding='utf-8') as source:
+        tree = ast.parse(source.read(), spec.origin)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == 'VERSION' for target in node.targets):
+            try:
+                return ast.literal_eval(node.value)
+            except ValueError:
+                return None
+    return None
+
+
+def versions() -> typing.Dict[str, str]:
+    """
+    Versions of the core and of the extensions
+    :return:
+    """
+    from . import VERSION, EXTENSIONS
+
+    result = {'CORE': VERSION}
+    for extension in EXTENSIONS:
+        version = module_version(extension)
+        if version is not None:
+            result[extension] = version
+    return result
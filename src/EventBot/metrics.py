@@ -0,0 +1,269 @@
+"""
+Metrics of the bot: counters and latency histograms, rendered in the Prometheus text format
+"""
+import asyncio
+import bisect
+import logging
+import typing
+
+logger = logging.getLogger(__name__)
+
+"""
+Default histogram buckets (seconds)
+"""
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = typing.Tuple[str, ...]
+
+
+class Counter:
+    """
+    Counter by label values
+    """
+
+    def __init__(self, name: str, documentation: str, labels: typing.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: typing.Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        """
+        Increment the counter
+        :param labels: Label values
+        :param value: Increment
+        :return:
+        """
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self) -> typing.List[str]:
+        """
+        Prometheus text lines
+        :return:
+        """
+        lines = ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} counter".format(self.name)]
+        for labels, value in sorted(self.values.items()):
+            lines.append("{}{} {}".format(self.name, format_labels(self.labels, labels), value))
+        return lines
+
+
+class Gauge:
+    """
+    Current value by label values
+    """
+
+    def __init__(self, name: str, documentation: str, labels: typing.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: typing.Dict[Labels, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        """
+        Set the value
+        :param value: New value
+        :param labels: Label values
+        :return:
+        """
+        self.values[labels] = value
+
+    def render(self) -> typing.List[str]:
+        """
+        Prometheus text lines
+        :return:
+        """
+        lines = ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} gauge".format(self.name)]
+        for labels, value in sorted(self.values.items()):
+            lines.append("{}{} {}".format(self.name, format_labels(self.labels, labels), value))
+        return lines
+
+
+class Histogram:
+    """
+    Latency histogram by label values
+    """
+
+    def __init__(self, name: str, documentation: str, labels: typing.Sequence[str] = (),
+                 buckets: typing.Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+
+        """
+        By label values: [count per bucket (the last one is +Inf), sum]
+        """
+        self.values: typing.Dict[Labels, typing.List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """
+        Add a measure
+        :param value: Measure (seconds)
+        :param labels: Label values
+        :return:
+        """
+        if labels not in self.values:
+            self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        counts, _ = self.values[labels]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.values[labels][1] += value
+
+    def count(self, *labels: str) -> int:
+        """
+        Number of measures
+        :param labels: Label values
+        :return:
+        """
+        return sum(self.values[labels][0]) if labels in self.values else 0
+
+    def sum(self, *labels: str) -> float:
+        """
+        Sum of the measures
+        :param labels: Label values
+        :return:
+        """
+        return self.values[labels][1] if labels in self.values else 0.0
+
+    def quantile(self, q: float, *labels: str) -> typing.Optional[float]:
+        """
+        Upper bound of the bucket holding a quantile
+        :param q: Quantile (0.95 for the 95th percentile)
+        :param labels: Label values
+        :return: None without measures, inf if the quantile is over the last bucket
+        """
+        total = self.count(*labels)
+        if total == 0:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.values[labels][0]):
+            seen += count
+            if seen >= q * total:
+                return bound
+        return float('inf')
+
+    def render(self) -> typing.List[str]:
+        """
+        Prometheus text lines
+        :return:
+        """
+        lines = ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} histogram".format(self.name)]
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(
+                    self.name,
+                    format_labels(self.labels + ('le',), labels + ('+Inf' if bound == float('inf') else str(bound),)),
+                    cumulative
+                ))
+            lines.append("{}_sum{} {}".format(self.name, format_labels(self.labels, labels), total))
+            lines.append("{}_count{} {}".format(self.name, format_labels(self.labels, labels), cumulative))
+        return lines
+
+
+def format_labels(names: Labels, values: Labels) -> str:
+    """
+    Prometheus label set
+    :param names: Label names
+    :param values: Label values
+    :return:
+    """
+    if not names:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    ) for name, value in zip(names, values)) + "}"
+
+
+COMMANDS = Histogram('eventbot_command_seconds', 'Command duration', ('command', 'status'))
+LISTENERS = Histogram('eventbot_listener_seconds', 'Gateway event listener duration', ('event',))
+REQUESTS = Histogram('eventbot_http_request_seconds', 'REST request duration', ('method', 'route', 'status'))
+RATE_LIMITS = Counter('eventbot_http_ratelimited_total', 'REST 429 responses', ('route', 'scope'))
+RETRY_AFTER = Counter('eventbot_http_retry_after_seconds_total', 'Time waited after 429 responses', ('route',))
+GUILD_UPDATES = Histogram('eventbot_guild_update_seconds', 'Guild update duration', ('guild', 'status'))
+ROLE_QUEUE_DEPTH = Gauge('eventbot_role_queue_depth', 'Role changes waiting or running', ('guild',))
+ROLE_QUEUE_DRAIN = Histogram('eventbot_role_queue_drain_seconds', 'Time to drain the role queue', ('guild',))
+ROLE_CHANGES = Counter('eventbot_role_changes_total', 'Role changes sent or coalesced', ('guild', 'result'))
+STRAY_REACTIONS = Counter('eventbot_stray_reactions_total', 'Reactions other than ✅ on open events', ('guild',))
+STRAY_CLEARS = Counter('eventbot_stray_clear_requests_total', 'Requests sent to clear stray reactions', ('guild',))
+
+"""
+All metrics, in rendering order
+"""
+METRICS = (
+    COMMANDS, LISTENERS, REQUESTS, RATE_LIMITS, RETRY_AFTER, GUILD_UPDATES,
+    ROLE_QUEUE_DEPTH, ROLE_QUEUE_DRAIN, ROLE_CHANGES, STRAY_REACTIONS, STRAY_CLEARS,
+)
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text format
+    :return:
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RateLimitHandler(logging.Handler):
+    """
+    Count the 429 responses from the warnings of discord.http (they are retried inside discord.py,
+    so the request wrapper never sees them)
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not isinstance(record.msg, str) or not record.args:
+            return
+        if record.msg.startswith('We are being rate limited'):
+            retry_after, bucket = record.args
+            route = str(bucket).split(':', 2)[-1]
+            RATE_LIMITS.inc(route, 'bucket')
+            RETRY_AFTER.inc(route, value=retry_after)
+        elif record.msg.startswith('Global rate limit'):
+            RATE_LIMITS.inc('*', 'global')
+
+
+def watch_rate_limits() -> None:
+    """
+    Install the 429 counter on the discord.http logger
+    :return:
+    """
+    http_logger = logging.getLogger('discord.http')
+    if not any(isinstance(handler, RateLimitHandler) for handler in http_logger.handlers):
+        handler = RateLimitHandler(logging.WARNING)
+        http_logger.addHandler(handler)
+        if http_logger.getEffectiveLevel() > logging.WARNING:
+            http_logger.setLevel(logging.WARNING)
+
+
+async def serve(host: str, port: int) -> typing.Optional[asyncio.AbstractServer]:
+    """
+    Serve the metrics over HTTP (any path)
+    :param host: Listen address
+    :param port: Listen port
+    :return: The server, None if the port is not available
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = render().encode()
+            writer.write(
+                b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                + "Content-Length: {}\r\n\r\n".format(len(body)).encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    try:
+        server = await asyncio.start_server(handle, host, port)
+    except OSError as error:
+        logger.warning("Metrics endpoint not available on %s:%d: %s", host, port, error)
+        return None
+    logger.info("Metrics endpoint on http://%s:%d/metrics", host, port)
+    return server
@@ -1,61 +1,205 @@
 import discord
+import re
+import typing
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+"""
+Announce patterns: event date, event name and games masters mentions
+"""
+DATE_PATTERN = re.compile(r'([0-9]{2})/([0-9]{2}) à ([0-9]{2}) h ([0-9]{2})')
+NAME_PATTERN = re.compile(r'\*\*(.*)\*\*')
+GM_PATTERN = re.compile(r'<@!?([0-9]+)>')
+
+"""
+Max number of parsed announces kept in cache
+"""
+PARSE_CACHE_SIZE = 4096
+
+
+class ParsedAnnounce(typing.NamedTuple):
+    """
+    Data read in an announce
+    """
+    date: typing.Optional[datetime]
+    name: typing.Optional[str]
+    games_masters: typing.Tuple[int, ...]
+
+
+_parse_cache: 'OrderedDict[typing.Tuple[int, typing.Optional[datetime]], ParsedAnnounce]' = OrderedDict()
+
+
+def parse_announce(message_id: int, content: str, edited_at: typing.Optional[datetime] = None) -> ParsedAnnounce:
+    """
+    Parse an announce.
+    The year of the event is deduced from the announce creation date (the message ID), so a message
+    always gives the same result and is cached until it is edited.
+    :param message_id: Announce message ID
+    :param content: Message content
+    :param edited_at: Last edition date of the message
+    :return:
+    """
+    key = (message_id, edited_at)
+    parsed = _parse_cache.get(key)
+    if parsed is not None:
+        _parse_cache.move_to_end(key)
+        return parsed
+
+    date = None
+    date_element = DATE_PATTERN.search(content)
+    if date_element is not None:
+        day, month, hour, minute = map(int, date_element.groups())
+        posted = discord.utils.snowflake_time(message_id)
+        try:
+            date = datetime(posted.year + 1 if posted.month > month else posted.year, month, day, hour, minute)
+        except ValueError:
+            pass
+
+    name = NAME_PATTERN.search(content)
+    games_masters = map(int, GM_PATTERN.findall(content))
+
+    parsed = ParsedAnnounce(date, name.group(1) if name is not None else None, tuple(games_masters))
+    _parse_cache[key] = parsed
+    if len(_parse_cache) > PARSE_CACHE_SIZE:
+        _parse_cache.popitem(last=False)
+    return parsed
+
+
+def clear_parse_cache() -> None:
+    """
+    Forget all parsed announces
+    :return:
+    """
+    _parse_cache.clear()
+
 
 class EventMessage:
     """
-    Class for parsing a announce and get an event
+    Immutable event record read from an announce: only the IDs, the date, the name and the games masters.
+    The announce message is not kept, it is fetched again when needed (opening, deletion).
+    """
+    __slots__ = ('id', 'channel_id', 'date', 'name', 'games_masters')
+
     """
+    Default event name
+    """
+    DEFAULT_NAME = "Soirée jeux"
+
+    id: int
+    channel_id: int
+    date: typing.Optional[datetime]
+    name: str
+    games_masters: typing.Tuple[int, ...]
+
+    def __init__(self, message_id: int, channel_id: int, date: typing.Optional[datetime] = None,
+                 name: typing.Optional[str] = None, games_masters: typing.Iterable[int] = ()):
+        """
+        :param message_id: Announce message ID
+        :param channel_id: Announce channel ID
+        :param date: Event date
+        :param name: Event name
+        :param games_masters: Games masters IDs
+        """
+        object.__setattr__(self, 'id', message_id)
+        object.__setattr__(self, 'channel_id', channel_id)
+        object.__setattr__(self, 'date', date)
+        object.__setattr__(self, 'name', name if name is not None else self.DEFAULT_NAME)
+        object.__setattr__(self, 'games_masters', tuple(games_masters))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("EventMessage is immutable")
 
-    def __init__(self, config: 'BotConfig', message: discord.Message = None):
+    def __delattr__(self, name):
+        raise AttributeError("EventMessage is immutable")
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, EventMessage):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self) -> str:
+        return "<EventMessage id={} date={} name={!r}>".format(self.id, self.date, self.name)
+
+    @classmethod
+    def from_content(cls, message_id: int, channel_id: int, content: str,
+                     edited_at: typing.Optional[datetime] = None) -> 'EventMessage':
+        """
+        Read an event from an announce content
+        :param message_id: Announce message ID
+        :param channel_id: Announce channel ID
+        :param content: The message content
+        :param edited_at: Last edition date of the message
+        :return:
+        """
+        parsed = parse_announce(message_id, content, edited_at)
+        return cls(message_id, channel_id, parsed.date, parsed.name, parsed.games_masters)
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> 'EventMessage':
         """
-        Parse a message and get event data
+        Read an event from an announce
         :param message: A discord message to parse as an event
+        :return:
+        """
+        return cls.from_content(message.id, message.channel.id, message.content, message.edited_at)
+
+    @classmethod
+    def from_row(cls, row) -> 'EventMessage':
         """
-        import re
-
-        self.date = None
-        self.close_date = None
-        self.open_date = None
-        self.name = "Soirée jeux"
-        self.games_masters = []
-        self.players = None
-        self.message = message
-        self.config = config
-
-        if message is not None:
-            self.id = message.id
-            date_element = re.search(r'([0-9]{2})/([0-9]{2}) à ([0-9]{2}) h ([0-9]{2})', message.content)
-            name_parse = re.search(r'\*\*(.*)\*\*', message.content)
-            if name_parse is not None:
-                self.name = name_parse.group(1)
-            if date_element is not None:
-                now = datetime.now()
-                day = int(date_element.group(1))
-                month = int(date_element.group(2))
-                hour = int(date_element.group(3))
-                minutes = int(date_element.group(4))
-                year = now.year + 1 if now.month > month else now.year
-                self.date = datetime(year=year, month=month, day=day, hour=hour, minute=minutes)
-                self.close_date = self.date + timedelta(hours=4)
-                self.open_date = self.date - timedelta(hours=1)
-
-            self.games_masters = re.findall('<@([^>]*)>', message.content)
+        Build an event from the local event store
+        :param row: Row of the event store
+        :return:
+        """
+        from .store import EventStore
+
+        return cls(
+            row['message_id'], row['channel_id'], EventStore.parse_date(row['date']), row['name'],
+            EventStore.parse_games_masters(row['games_masters'])
+        )
 
     @property
-    def is_open(self) -> bool:
+    def open_date(self) -> typing.Optional[datetime]:
+        """
+        Opening of the registrations, one hour before the event
+        :return:
+        """
+        return self.date - timedelta(hours=1) if self.date is not None else None
+
+    @property
+    def close_date(self) -> typing.Optional[datetime]:
+        """
+        End of the event, four hours after its start
+        :return:
+        """
+        return self.date + timedelta(hours=4) if self.date is not None else None
+
+    async def fetch_message(self, config: 'BotConfig') -> discord.Message:
+        """
+        Fetch the announce message
+        :param config: Bot configuration
+        :return:
+        """
+        channel = config.announce if config.announce_id == self.channel_id else config.bot.get_channel(self.channel_id)
+        return await channel.fetch_message(self.id)
+
+    def is_open(self, config: 'BotConfig') -> bool:
         """
         Is the event open ?
+        :param config: Bot configuration
         :return:
         """
-        return self.config.reactions_cog.message is not None and self.config.reactions_cog.message.id == self.message.id
+        return self.id in config.reactions_cog.watched
 
-    async def open(self) -> None:
+    async def open(self, config: 'BotConfig') -> None:
         """
         Open this event
+        :param config: Bot configuration
         :return:
         """
-        await self.config.reactions_cog.set_message(self.message)
+        await config.reactions_cog.watch(await self.fetch_message(config))
 
     @property
     def can_close(self) -> bool:
@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta
+import discord
+import math
+import typing
+
+"""
+Bulk delete only accepts messages younger than 14 days (with a margin for the request time)
+"""
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+
+"""
+Max number of messages in a bulk delete
+"""
+BULK_DELETE_SIZE = 100
+
+"""
+Number of requests of the clone strategy (clone, move at the same position, delete the old channel)
+"""
+CLONE_COST = 3
+
+
+class PurgeReport:
+    """
+    Result of a channel purge
+    """
+
+    def __init__(self, strategy: str, estimated_requests: int = 0):
+        self.strategy = strategy
+        self.estimated_requests = estimated_requests
+        self.deleted = 0
+        self.requests = 0
+
+    def __str__(self) -> str:
+        return "{} strategy: {} messages deleted in {} requests (estimated {})".format(
+            self.strategy, self.deleted, self.requests, self.estimated_requests
+        )
+
+
+def bulk_cost(young: int, old: int) -> int:
+    """
+    Requests needed to delete messages with the bulk strategy
+    :param young: Messages younger than 14 days
+    :param old: Older messages (deleted one by one)
+    :return:
+    """
+    return math.ceil(young / BULK_DELETE_SIZE) + old
+
+
+def estimate(channel: discord.TextChannel, sample: typing.Sequence[discord.Message],
+             since: typing.Optional[datetime] = None) -> typing.Tuple[int, int]:
+    """
+    Estimate the number of messages in a channel from its newest messages
+    :param channel: The channel
+    :param sample: Newest messages (one history page)
+    :param since: Last purge of the channel (UTC), the channel was empty then
+    :return: (messages younger than 14 days, older messages)
+    """
+    now = datetime.utcnow()
+    cutoff = now - BULK_DELETE_MAX_AGE
+    young = sum(1 for message in sample if message.created_at > cutoff)
+    if len(sample) < BULK_DELETE_SIZE:
+        return young, len(sample) - young
+
+    # Full page: extrapolate the message rate of the sample to the channel life since its last purge
+    start = max(channel.created_at, since) if since is not None else channel.created_at
+    start = min(start, sample[-1].created_at)
+    span = max((sample[0].created_at - sample[-1].created_at).total_seconds(), 1)
+    rate = len(sample) / span
+    young = max(young, int(rate * min(now - start, BULK_DELETE_MAX_AGE).total_seconds()))
+    old = max(len(sample) - young, int(rate * max((cutoff - start).total_seconds(), 0)))
+    return young, old
+
+
+async def purge_bulk(channel: discord.TextChannel, report: PurgeReport,
+                     first_page: typing.Optional[typing.Sequence[discord.Message]] = None) -> discord.TextChannel:
+    """
+    Delete all messages in a single pass on the history: bulk deletes of 100 messages, then single deletes
+    for the messages older than 14 days.
+    :param channel: Channel to purge
+    :param report: Purge report to fill
+    :param first_page: Newest messages, already read (one history page)
+    :return: The channel
+    """
+    cutoff = datetime.utcnow() - BULK_DELETE_MAX_AGE
+    chunk = []
+
+    async def flush():
+        if chunk:
+            await channel.delete_messages(chunk)
+            report.deleted += len(chunk)
+            report.requests += 1
+            chunk.clear()
+
+    async def pages():
+        if first_page is None:
+            history = channel.history(limit=None)
+        elif len(first_page) < BULK_DELETE_SIZE:
+            history = None
+        else:
+            history = channel.history(limit=None, before=first_page[-1])
+
+        for message in first_page or ():
+            yield message
+        if history is not None:
+            async for message in history:
+                yield message
+
+    async for message in pages():
+        if message.created_at > cutoff:
+            chunk.append(message)
+            if len(chunk) == BULK_DELETE_SIZE:
+                await flush()
+        else:
+            await flush()
+            await message.delete()
+            report.deleted += 1
+            report.requests += 1
+    await flush()
+    return channel
+
+
+async def purge_clone(channel: discord.TextChannel, report: PurgeReport) -> discord.TextChannel:
+    """
+    Replace the channel by an empty copy
+    :param channel: Channel to purge
+    :param report: Purge report to fill
+    :return: The new channel
+    """
+    new_channel = await channel.clone(reason="Purge of the event channel")
+    await new_channel.edit(position=channel.position)
+    await channel.delete(reason="Purge of the event channel")
+    report.requests += CLONE_COST
+    return new_channel
+
+
+async def purge(channel: discord.TextChannel, strategy: str = 'auto', clone_threshold: typing.Optional[int] = None,
+                since: typing.Optional[datetime] = None) -> typing.Tuple[discord.TextChannel, PurgeReport]:
+    """
+    Delete all messages of a channel
+    :param channel: Channel to purge
+    :param strategy: 'bulk', 'clone' or 'auto'
+    :param clone_threshold: In auto mode, clone the channel if the bulk strategy needs more requests
+    than this (None: never clone)
+    :param since: Last purge of the channel (UTC), None if unknown
+    :return: The purged channel (a new one with the clone strategy) and the report
+    """
+    if strategy == 'clone':
+        report = PurgeReport('clone', CLONE_COST)
+        return await purge_clone(channel, report), report
+
+    first_page = await channel.history(limit=BULK_DELETE_SIZE).flatten()
+    young, old = estimate(channel, first_page, since)
+    cost = bulk_cost(young, old)
+
+    if strategy == 'auto' and clone_threshold is not None and cost > clone_threshold:
+        report = PurgeReport('clone', CLONE_COST)
+        report.requests += 1
+        return await purge_clone(channel, report), report
+
+    report = PurgeReport('bulk', cost)
+    report.requests += 1
+    return await purge_bulk(channel, report, first_page), report
@@ -0,0 +1,80 @@
+"""
+Record of the gateway dispatches, replayed by EventBot.bench.replay
+"""
+import gzip
+import json
+import time
+import typing
+
+"""
+Version of the record format
+"""
+FORMAT_VERSION = 1
+
+
+class GatewayRecorder:
+    """
+    Write the gateway dispatches in a gzipped JSON lines file.
+    The first line is a header, then each line is [milliseconds since the start, event name, payload].
+    """
+
+    def __init__(self, path: str, events: typing.Optional[typing.Collection[str]] = None):
+        """
+        :param path: Record file
+        :param events: Dispatch names to record (READY and GUILD_CREATE are always kept), all if None
+        """
+        self.path = path
+        self.events = None if events is None else set(events) | {'READY', 'GUILD_CREATE'}
+        self.started = time.monotonic()
+        self.count = 0
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self._write({'version': FORMAT_VERSION, 'started': time.time()})
+
+    def _write(self, item) -> None:
+        self.file.write(json.dumps(item, separators=(',', ':'), ensure_ascii=False))
+        self.file.write("\n")
+
+    async def on_socket_response(self, msg: dict) -> None:
+        """
+        Gateway message listener
+        :param msg: Decoded gateway message
+        :return:
+        """
+        if msg.get('op') != 0 or (self.events is not None and msg.get('t') not in self.events):
+            return
+        self.write(msg['t'], msg['d'])
+
+    def write(self, event: str, data: dict, offset: float = None) -> None:
+        """
+        Write a dispatch
+        :param event: Dispatch name
+        :param data: Payload
+        :param offset: Seconds since the start of the record, now by default
+        :return:
+        """
+        if offset is None:
+            offset = time.monotonic() - self.started
+        self._write([round(offset * 1000), event, data])
+        self.count += 1
+
+    def close(self) -> None:
+        """
+        Flush and close the file
+        :return:
+        """
+        self.file.close()
+
+
+def read(path: str) -> typing.Iterator[typing.Tuple[int, str, dict]]:
+    """
+    Read a record
+    :param path: Record file
+    :return: (milliseconds since the start, event name, payload) for each dispatch
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        header = json.loads(next(file))
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError("Unsupported record version: {}".format(header.get('version')))
+        for line in file:
+            offset, event, data = json.loads(line)
+            yield offset, event, data
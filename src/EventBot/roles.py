@@ -0,0 +1,210 @@
+from collections import OrderedDict
+from discord.ext import commands
+import asyncio
+import discord
+import time
+import typing
+from . import metrics
+from .members import MemberCache
+
+"""
+How long a role change applied by the queue is trusted over the member cache (seconds),
+until the gateway member update is received
+"""
+CONFIRM_DELAY = 30.0
+
+
+class RoleChange:
+    """
+    A pending role change
+    """
+
+    def __init__(self, present: bool, reason: typing.Optional[str], future: asyncio.Future):
+        """
+        :param present: True to add the role, False to remove it
+        :param reason: Audit log reason
+        :param future: Resolved when the change is done (True) or dropped (False)
+        """
+        self.present = present
+        self.reason = reason
+        self.future = future
+
+
+class RoleQueue:
+    """
+    Queue of role changes of a guild.
+    Changes for the same member and role are coalesced (only the last wanted state is kept, and nothing
+    is sent if the member already has this state). The queue is drained with a bounded number of
+    concurrent requests, so discord.py's per-route rate limits are not flooded.
+    The depth, the drain time and the sent and coalesced changes are exported in the metrics.
+    """
+
+    def __init__(self, bot: commands.Bot, guild_id: int, concurrency: int = 4,
+                 members: typing.Optional[MemberCache] = None):
+        """
+        :param bot: Bot agent
+        :param guild_id: Guild ID
+        :param concurrency: Max number of concurrent requests
+        :param members: Members of the guild, the bot cache if None
+        """
+        self.bot = bot
+        self.guild_id = guild_id
+        self.concurrency = concurrency
+        self.members = members
+        self.pending: 'OrderedDict[typing.Tuple[int, int], RoleChange]' = OrderedDict()
+        self.in_flight: typing.Dict[typing.Tuple[int, int], bool] = {}
+        self.applied: typing.Dict[typing.Tuple[int, int], typing.Tuple[bool, float]] = {}
+        self.workers = 0
+        self.drain_started: typing.Optional[float] = None
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+    @property
+    def depth(self) -> int:
+        """
+        Number of changes waiting or running
+        :return:
+        """
+        return len(self.pending) + len(self.in_flight)
+
+    def add(self, member: typing.Union[int, discord.abc.Snowflake], role: discord.abc.Snowflake,
+            reason: str = None) -> asyncio.Future:
+        """
+        Queue a role addition
+        :param member: Member (or member ID)
+        :param role: Role to add
+        :param reason: Audit log reason
+        :return: Future resolved to True when the role is added, False if nothing had to be done
+        """
+        return self._queue(member, role, True, reason)
+
+    def remove(self, member: typing.Union[int, discord.abc.Snowflake], role: discord.abc.Snowflake,
+               reason: str = None) -> asyncio.Future:
+        """
+        Queue a role removal
+        :param member: Member (or member ID)
+        :param role: Role to remove
+        :param reason: Audit log reason
+        :return: Future resolved to True when the role is removed, False if nothing had to be done
+        """
+        return self._queue(member, role, False, reason)
+
+    async def wait_drained(self) -> None:
+        """
+        Wait until all queued changes are done
+        :return:
+        """
+        await self._drained.wait()
+
+    def has_role(self, member_id: int, role_id: int) -> typing.Optional[bool]:
+        """
+        Does a member have a role (from the changes applied by the queue, then from the member cache)
+        :param member_id: Member ID
+        :param role_id: Role ID
+        :return: None if unknown
+        """
+        key = (member_id, role_id)
+        if self.members is not None:
+            member = self.members.get(member_id)
+        else:
+            guild = self.bot.get_guild(self.guild_id)
+            member = guild.get_member(member_id) if guild is not None else None
+        cached = None if member is None else discord.utils.get(member.roles, id=role_id) is not None
+
+        if key in self.applied:
+            present, applied_at = self.applied[key]
+            if cached == present or time.monotonic() - applied_at > CONFIRM_DELAY:
+                del self.applied[key]
+            else:
+                return present
+        return cached
+
+    def _queue(self, member: typing.Union[int, discord.abc.Snowflake], role: discord.abc.Snowflake,
+               present: bool, reason: typing.Optional[str]) -> asyncio.Future:
+        """
+        Queue a role change, replacing the pending change for the same member and role
+        :param member: Member (or member ID)
+        :param role: The role
+        :param present: True to add the role, False to remove it
+        :param reason: Audit log reason
+        :return:
+        """
+        member_id = member if isinstance(member, int) else member.id
+        key = (member_id, role.id)
+        future = asyncio.get_event_loop().create_future()
+
+        previous = self.pending.pop(key, None)
+        if previous is not None:
+            metrics.ROLE_CHANGES.inc(str(self.guild_id), 'coalesced')
+            previous.future.set_result(False)
+
+        expected = self.in_flight[key] if key in self.in_flight else self.has_role(member_id, role.id)
+        if expected == present:
+            if previous is None:
+                metrics.ROLE_CHANGES.inc(str(self.guild_id), 'coalesced')
+            future.set_result(False)
+            self._check_drained()
+            return future
+
+        self.pending[key] = RoleChange(present, reason, future)
+        metrics.ROLE_QUEUE_DEPTH.set(self.depth, str(self.guild_id))
+        if self.drain_started is None:
+            self.drain_started = time.monotonic()
+            self._drained.clear()
+        while self.workers < min(self.concurrency, len(self.pending)):
+            self.workers += 1
+            asyncio.ensure_future(self._worker())
+        return future
+
+    def _next(self) -> typing.Optional[typing.Tuple[typing.Tuple[int, int], RoleChange]]:
+        """
+        Take the oldest pending change whose member and role has no running request
+        :return:
+        """
+        for key in self.pending:
+            if key not in self.in_flight:
+                return key, self.pending.pop(key)
+        return None
+
+    async def _worker(self) -> None:
+        """
+        Send pending changes until the queue is empty
+        :return:
+        """
+        try:
+            while True:
+                item = self._next()
+                if item is None:
+                    return
+                key, change = item
+                member_id, role_id = key
+                self.in_flight[key] = change.present
+                try:
+                    if change.present:
+                        await self.bot.http.add_role(self.guild_id, member_id, role_id, reason=change.reason)
+                    else:
+                        await self.bot.http.remove_role(self.guild_id, member_id, role_id, reason=change.reason)
+                except Exception as error:
+                    change.future.set_exception(error)
+                else:
+                    metrics.ROLE_CHANGES.inc(str(self.guild_id), 'sent')
+                    self.applied[key] = (change.present, time.monotonic())
+                    if self.members is not None:
+                        self.members.role_changed(member_id, role_id, change.present)
+                    change.future.set_result(True)
+                finally:
+                    del self.in_flight[key]
+                    metrics.ROLE_QUEUE_DEPTH.set(self.depth, str(self.guild_id))
+        finally:
+            self.workers -= 1
+            self._check_drained()
+
+    def _check_drained(self) -> None:
+        """
+        Record the drain time when the queue becomes empty
+        :return:
+        """
+        if self.depth == 0 and self.workers == 0 and self.drain_started is not None:
+            metrics.ROLE_QUEUE_DRAIN.observe(time.monotonic() - self.drain_started, str(self.guild_id))
+            self.drain_started = None
+            self._drained.set()
@@ -0,0 +1,285 @@
+import sqlite3
+import typing
+from datetime import datetime
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class EventStore:
+    """
+    Local index of the announce channels.
+    Events are keyed by guild and message ID. They are loaded in the in-memory event index at startup,
+    so the channel history is not read again from the start.
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        """
+        Open (or create) the store
+        :param path: SQLite database file, in memory by default
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        # A commit by reaction checkpoint: with the write-ahead log, a commit does not wait for a fsync
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                guild_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                date TEXT,
+                name TEXT NOT NULL,
+                games_masters TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (guild_id, message_id)
+            );
+            CREATE INDEX IF NOT EXISTS events_by_date ON events (guild_id, channel_id, date);
+            CREATE TABLE IF NOT EXISTS channels (
+                guild_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                PRIMARY KEY (guild_id, channel_id)
+            );
+            CREATE TABLE IF NOT EXISTS channel_purges (
+                guild_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                purged_at TEXT NOT NULL,
+                PRIMARY KEY (guild_id, channel_id)
+            );
+            CREATE TABLE IF NOT EXISTS open_events (
+                message_id INTEGER NOT NULL PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                checkpoint_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS open_event_users (
+                message_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                PRIMARY KEY (message_id, user_id, kind)
+            );
+        """)
+        self.db.commit()
+
+    def close(self) -> None:
+        """
+        Close the database
+        :return:
+        """
+        self.db.close()
+
+    def last_message_id(self, guild_id: int, channel_id: int) -> typing.Optional[int]:
+        """
+        Last message indexed for a channel
+        :param guild_id: Guild ID
+        :param channel_id: Announce channel ID
+        :return: The message ID, None if the channel was never filled
+        """
+        row = self.db.execute(
+            "SELECT last_message_id FROM channels WHERE guild_id = ? AND channel_id = ?",
+            (guild_id, channel_id)
+        ).fetchone()
+        return None if row is None else row['last_message_id']
+
+    def mark_filled(self, guild_id: int, channel_id: int, last_message_id: int) -> None:
+        """
+        Record that the channel history is indexed up to a message
+        :param guild_id: Guild ID
+        :param channel_id: Announce channel ID
+        :param last_message_id: Last message read in history
+        :return:
+        """
+        self.db.execute(
+            "INSERT INTO channels (guild_id, channel_id, last_message_id) VALUES (?, ?, ?) "
+            "ON CONFLICT (guild_id, channel_id) DO UPDATE SET "
+            "last_message_id = MAX(last_message_id, excluded.last_message_id)",
+            (guild_id, channel_id, last_message_id)
+        )
+        self.db.commit()
+
+    def forget_channel(self, guild_id: int, channel_id: int) -> None:
+        """
+        Drop the index of a channel, the next sync will read the full history again
+        :param guild_id: Guild ID
+        :param channel_id: Announce channel ID
+        :return:
+        """
+        self.db.execute("DELETE FROM events WHERE guild_id = ? AND channel_id = ?", (guild_id, channel_id))
+        self.db.execute("DELETE FROM channels WHERE guild_id = ? AND channel_id = ?", (guild_id, channel_id))
+        self.db.commit()
+
+    def last_purge(self, guild_id: int, channel_id: int) -> typing.Optional[datetime]:
+        """
+        Last purge of a channel
+        :param guild_id: Guild ID
+        :param channel_id: Channel ID
+        :return: The date (UTC), None if the channel was never purged
+        """
+        row = self.db.execute(
+            "SELECT purged_at FROM channel_purges WHERE guild_id = ? AND channel_id = ?",
+            (guild_id, channel_id)
+        ).fetchone()
+        return None if row is None else self.parse_date(row['purged_at'])
+
+    def mark_purged(self, guild_id: int, channel_id: int) -> None:
+        """
+        Record that a channel was just purged
+        :param guild_id: Guild ID
+        :param channel_id: Channel ID
+        :return:
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO channel_purges (guild_id, channel_id, purged_at) VALUES (?, ?, ?)",
+            (guild_id, channel_id, datetime.utcnow().strftime(DATE_FORMAT))
+        )
+        self.db.commit()
+
+    def upsert(self, guild_id: int, channel_id: int, message_id: int, date: typing.Optional[datetime],
+               name: str, games_masters: typing.Iterable[int], commit: bool = True) -> None:
+        """
+        Insert or replace an announce
+        :param guild_id: Guild ID
+        :param channel_id: Announce channel ID
+        :param message_id: Announce message ID
+        :param date: Event date, None if the message is not an event
+        :param name: Event name
+        :param games_masters: Games masters IDs
+        :param commit: Commit now, set to False for bulk inserts
+        :return:
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO events (guild_id, channel_id, message_id, date, name, games_masters) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                guild_id,
+                channel_id,
+                message_id,
+                date.strftime(DATE_FORMAT) if date is not None else None,
+                name,
+                ",".join(map(str, games_masters)),
+            )
+        )
+        self.db.execute(
+            "UPDATE channels SET last_message_id = MAX(last_message_id, ?) WHERE guild_id = ? AND channel_id = ?",
+            (message_id, guild_id, channel_id)
+        )
+        if commit:
+            self.db.commit()
+
+    def delete(self, guild_id: int, *message_ids: int) -> None:
+        """
+        Remove announces
+        :param guild_id: Guild ID
+        :param message_ids: Deleted messages IDs
+        :return:
+        """
+        self.db.executemany(
+            "DELETE FROM events WHERE guild_id = ? AND message_id = ?",
+            ((guild_id, message_id) for message_id in message_ids)
+        )
+        self.db.commit()
+
+    def events(self, guild_id: int, channel_id: int, limit: int = None) -> typing.List[sqlite3.Row]:
+        """
+        All announces, newest message first (like the channel history)
+        :param guild_id: Guild ID
+        :param channel_id: Announce channel ID
+        :param limit: Max number of rows
+        :return:
+        """
+        return self.db.execute(
+            "SELECT * FROM events WHERE guild_id = ? AND channel_id = ? ORDER BY message_id DESC LIMIT ?",
+            (guild_id, channel_id, -1 if limit is None else limit)
+        ).fetchall()
+
+    def save_open_event(self, guild_id: int, channel_id: int, message_id: int,
+                        reacted: typing.Iterable[int], banned: typing.Iterable[int]) -> None:
+        """
+        Checkpoint the whole state of an open event
+        :param guild_id: Guild ID
+        :param channel_id: Announce channel ID
+        :param message_id: Announce message ID
+        :param reacted: Users with a ✅ reaction
+        :param banned: Users kicked from the event
+        :return:
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO open_events (message_id, guild_id, channel_id, checkpoint_at) "
+            "VALUES (?, ?, ?, ?)",
+            (message_id, guild_id, channel_id, datetime.utcnow().strftime(DATE_FORMAT))
+        )
+        self.db.execute("DELETE FROM open_event_users WHERE message_id = ?", (message_id,))
+        self.db.executemany(
+            "INSERT INTO open_event_users (message_id, user_id, kind) VALUES (?, ?, ?)",
+            [(message_id, user_id, 'reacted') for user_id in reacted]
+            + [(message_id, user_id, 'banned') for user_id in banned]
+        )
+        self.db.commit()
+
+    def set_open_event_user(self, message_id: int, user_id: int, kind: str, present: bool) -> None:
+        """
+        Checkpoint a single change of an open event
+        :param message_id: Announce message ID
+        :param user_id: User ID
+        :param kind: 'reacted' or 'banned'
+        :param present: Add or remove the user
+        :return:
+        """
+        if present:
+            self.db.execute(
+                "INSERT OR IGNORE INTO open_event_users (message_id, user_id, kind) VALUES (?, ?, ?)",
+                (message_id, user_id, kind)
+            )
+        else:
+            self.db.execute(
+                "DELETE FROM open_event_users WHERE message_id = ? AND user_id = ? AND kind = ?",
+                (message_id, user_id, kind)
+            )
+        self.db.execute(
+            "UPDATE open_events SET checkpoint_at = ? WHERE message_id = ?",
+            (datetime.utcnow().strftime(DATE_FORMAT), message_id)
+        )
+        self.db.commit()
+
+    def delete_open_event(self, *message_ids: int) -> None:
+        """
+        Remove the checkpoint of closed events
+        :param message_ids: Announce messages IDs
+        :return:
+        """
+        params = [(message_id,) for message_id in message_ids]
+        self.db.executemany("DELETE FROM open_events WHERE message_id = ?", params)
+        self.db.executemany("DELETE FROM open_event_users WHERE message_id = ?", params)
+        self.db.commit()
+
+    def open_events(self) -> typing.List[typing.Tuple[sqlite3.Row, typing.Set[int], typing.Set[int]]]:
+        """
+        Checkpointed open events
+        :return: (event row, users with a ✅ reaction, banned users) for each event
+        """
+        users = {}
+        for row in self.db.execute("SELECT * FROM open_event_users"):
+            users.setdefault((row['message_id'], row['kind']), set()).add(row['user_id'])
+
+        return [
+            (row, users.get((row['message_id'], 'reacted'), set()), users.get((row['message_id'], 'banned'), set()))
+            for row in self.db.execute("SELECT * FROM open_events").fetchall()
+        ]
+
+    @staticmethod
+    def parse_date(value: typing.Optional[str]) -> typing.Optional[datetime]:
+        """
+        Read a date column
+        :param value: Stored value
+        :return:
+        """
+        return datetime.strptime(value, DATE_FORMAT) if value is not None else None
+
+    @staticmethod
+    def parse_games_masters(value: str) -> typing.List[int]:
+        """
+        Read the games masters column
+        :param value: Stored value
+        :return:
+        """
+        return [int(gm) for gm in value.split(",") if gm.isdigit()]